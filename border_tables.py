@@ -6,6 +6,11 @@ administrative borders for the synthetic ecosystem
 generation process
 """
 
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from error import SynthEcoError
+from logger import log
+
 
 class BorderTables:
     """
@@ -14,13 +19,23 @@ class BorderTables:
     Class to hold the geographic data for sampling and mapping
     """
 
-    def __init__(self, geo_unit_=None, converter_=None):
+    def __init__(self, geo_unit_=None, converter_=None, data_=None):
         """
         Creation Operator
+
+        Arguments:
+            geo_unit_: the geographic unit of the borders
+            converter_: the border census converter
+            data_: utility in case one wants to create an instance from an
+                   existing GeoDataFrame with GEO_UNIT and geometry columns
         """
         self.geo_unit = geo_unit_
         self.converter = converter_
-        self.data = self.converter.convert()
+        if data_ is None:
+            self.data = self.converter.convert()
+        else:
+            self.data = data_
+        self._build_index()
 
     def __str__(self):
         """
@@ -29,3 +44,104 @@ class BorderTables:
         return "\n".join(
             ["Border Tables", "".join(["_" for x in range(80)]), f"{self.data}"]
         )
+
+    def _build_index(self):
+        """
+        _build_index
+
+        Builds the GEO_UNIT -> geometry lookup, areas made of several rows get
+        the union of their geometries
+        """
+        geo_units = self.data["GEO_UNIT"]
+        if geo_units.is_unique:
+            self._geometries = dict(zip(geo_units, self.data.geometry))
+        else:
+            self._geometries = {
+                geo_unit: unary_union(list(group.geometry))
+                for geo_unit, group in self.data.groupby("GEO_UNIT", sort=False)
+            }
+        self._prepared = {}
+
+    def restrict_to(self, geo_units):
+        """
+        restrict_to
+
+        Keeps only the borders of the given geographic areas, so the lookups
+        and the spatial index only cover the areas that are used
+
+        Arguments:
+            geo_units: the geographic areas to keep, e.g. geos_of_interest
+
+        Returns:
+            self
+        """
+        keep = set(geo_units)
+        self.data = self.data[self.data["GEO_UNIT"].isin(keep)]
+        self._build_index()
+        missing = keep.difference(self._geometries)
+        if len(missing) > 0:
+            log("WARN", f"BorderTables: no borders for the geographic areas {missing}")
+        return self
+
+    def geometry(self, geo_unit):
+        """
+        geometry
+
+        Returns:
+            the border geometry of a geographic area
+        """
+        return self._geometries[geo_unit]
+
+    def geometries(self, geo_units=None):
+        """
+        geometries
+
+        Arguments:
+            geo_units: the geographic areas, all of them when None
+
+        Returns:
+            dictionary of GEO_UNIT -> border geometry
+        """
+        if geo_units is None:
+            return dict(self._geometries)
+        missing = [g for g in geo_units if g not in self._geometries]
+        if len(missing) > 0:
+            raise SynthEcoError(
+                "BorderTables.geometries: no borders for the geographic areas "
+                f"{', '.join(str(g) for g in missing)}"
+            )
+        return {g: self._geometries[g] for g in geo_units}
+
+    def prepared_geometry(self, geo_unit):
+        """
+        prepared_geometry
+
+        Returns:
+            the prepared border geometry of a geographic area for repeated
+            predicate tests, prepared on first use
+        """
+        if geo_unit not in self._prepared:
+            self._prepared[geo_unit] = prep(self._geometries[geo_unit])
+        return self._prepared[geo_unit]
+
+    @property
+    def sindex(self):
+        """
+        sindex
+
+        The STRtree spatial index of the border rows, built on first use
+        """
+        return self.data.sindex
+
+    def geo_units_intersecting(self, geometry):
+        """
+        geo_units_intersecting
+
+        Arguments:
+            geometry: a shapely geometry in the CRS of the borders
+
+        Returns:
+            array of the GEO_UNITs whose borders intersect geometry
+        """
+        rows = self.sindex.query(geometry, predicate="intersects")
+        return self.data["GEO_UNIT"].iloc[sorted(rows)].unique()
@@ -0,0 +1,96 @@
+"""
+border_reader
+
+This module houses the reader shared by the border converter plugins. It
+only loads and reprojects the border polygons of the geographic areas that
+are needed rather than a whole national file.
+"""
+
+import hashlib
+import os
+import geopandas as gpd
+from logger import log, data_log
+from util import file_hash
+
+
+def read_border_file(
+    border_file,
+    id_column,
+    prefixes=None,
+    geo_ids=None,
+    crs="WGS 84",
+    cache_location=None,
+):
+    """
+    read_border_file
+
+    Reads a border file keeping only the rows whose id starts with one of
+    the prefixes and, if given, is one of geo_ids. The prefix filter is given
+    to the reader as an attribute filter so the other rows are never parsed;
+    if the reader can not filter, the whole file is read and filtered after.
+    Only the rows that are kept are reprojected.
+
+    With a cache location, the result is written there as GeoParquet keyed
+    on the contents of the border file, the filters and the CRS, and later
+    reads with the same key memory-map it back instead of parsing the file.
+
+    Arguments:
+        border_file: the GML/shapefile with the borders
+        id_column: the column with the geographic area ids
+        prefixes: prefixes of the ids to keep, None to keep everything
+        geo_ids: the exact ids to keep, None to keep every id with a prefix
+        crs: the CRS to reproject to
+        cache_location: directory of the GeoParquet cache, None to not cache
+
+    Returns:
+        GeoDataFrame of the kept borders in crs
+    """
+    cache_file = None
+    if cache_location is not None:
+        key = hashlib.sha256(
+            repr(
+                [
+                    file_hash(border_file),
+                    id_column,
+                    None if prefixes is None else sorted(set(prefixes)),
+                    None if geo_ids is None else sorted(set(geo_ids)),
+                    str(crs),
+                ]
+            ).encode()
+        ).hexdigest()
+        cache_file = os.path.join(cache_location, f"borders_{key}.parquet")
+        if os.path.exists(cache_file):
+            log("INFO", f"border_reader: reading cached borders {cache_file}")
+            return gpd.read_parquet(cache_file, memory_map=True)
+
+    border_gdf = None
+    if prefixes is not None and len(prefixes) > 0:
+        where = " OR ".join(
+            f"{id_column} LIKE '{prefix}%'" for prefix in sorted(set(prefixes))
+        )
+        try:
+            border_gdf = gpd.read_file(border_file, where=where)
+        except Exception as e:
+            log(
+                "INFO",
+                f"border_reader: could not filter {border_file} while reading, "
+                + f"reading all of it\n{e}",
+            )
+
+    if border_gdf is None:
+        border_gdf = gpd.read_file(border_file)
+        if prefixes is not None and len(prefixes) > 0:
+            border_gdf = border_gdf[
+                border_gdf[id_column].astype(str).str.startswith(tuple(prefixes))
+            ]
+
+    if geo_ids is not None:
+        border_gdf = border_gdf[border_gdf[id_column].astype(str).isin(set(geo_ids))]
+
+    log("INFO", f"border_reader: read {border_gdf.shape[0]} borders from {border_file}")
+    border_gdf = border_gdf.to_crs(crs)
+
+    if cache_file is not None:
+        os.makedirs(cache_location, exist_ok=True)
+        border_gdf.to_parquet(cache_file)
+    return border_gdf
@@ -6,9 +6,11 @@ This is the code for the Canada Census Plugins
 
 import pandas as pd
 import numpy as np
-import geopandas as gpd
 import json
 from census_converters import hookimpl
+from census_converters.border_reader import read_border_file
+from census_converters.profile_reader import read_profile_data
+from census_converters.recoder import CommonVarRecoder
 from logger import log, data_log
 from error import SynthEcoError
 
@@ -43,26 +45,15 @@ class CanadaCensusGlobalPlugin:
                 "census_input_files"
             ]["profile_data_csv"]
 
-            prof_iter = pd.read_csv(
+            return read_profile_data(
                 profile_data_csv,
-                iterator=True,
-                dtype={
-                    "GEO_CODE (POR)": str,
-                    "DIM: Profile of Census Tracts (2247)": str,
-                },
-                chunksize=1000,
+                low_res_geo,
+                high_res_geo,
+                census_year,
+                profile_store=cens_conv_inst.input_params["profile_store"]
+                if cens_conv_inst.input_params.has_keyword("profile_store")
+                else None,
             )
-            raw_df = pd.concat(
-                [
-                    chunk[
-                        (chunk["GEO_CODE (POR)"].str.find(str(low_res_geo), 0) == 0)
-                        & (chunk["GEO_LEVEL"] == high_res_geo)
-                        & (chunk["CENSUS_YEAR"] == census_year)
-                    ]
-                    for chunk in prof_iter
-                ]
-            )
-            return raw_df
         except Exception as e:
             raise SynthEcoError(
                 "CanadaCensusGlobalPlugin: read_raw_data_into_pandas\n{}".format(e)
@@ -95,7 +86,8 @@ class CanadaCensusGlobalPlugin:
                     "ALT_GEO_CODE",
                     "Member ID: Profile of Census Tracts (2247)",
                     "DATA_QUALITY_FLAG",
-                ]
+                ],
+                errors="ignore",
             )
             pop_df = pop_df.rename(
                 columns={
@@ -121,7 +113,8 @@ class CanadaCensusGlobalPlugin:
                     "ALT_GEO_CODE",
                     "Member ID: Profile of Census Tracts (2247)",
                     "DATA_QUALITY_FLAG",
-                ]
+                ],
+                errors="ignore",
             )
             nh_df = nh_df.rename(
                 columns={
@@ -187,8 +180,8 @@ class CanadaCensusSummaryPlugin:
         Returns:
             returns the raw data table from the canadian census profile data
 
-        NOTE: This is duplicating the globals as it has the same data, would
-        be good to implement some sort of caching that would not need to do this
+        NOTE: This is the same data as the globals, the profile file is only
+        read once and shared through profile_reader
         """
         try:
             census_year = cens_conv_inst.input_params.input_params["census_year"]
@@ -209,26 +202,15 @@ class CanadaCensusSummaryPlugin:
                     "CanadaCensusSummaryPlugin requires global_tables to be defined in order to work"
                 )
 
-            prof_iter = pd.read_csv(
+            return read_profile_data(
                 profile_data_csv,
-                iterator=True,
-                dtype={
-                    "GEO_CODE (POR)": str,
-                    "DIM: Profile of Census Tracts (2247)": str,
-                },
-                chunksize=1000,
+                low_res_geo,
+                high_res_geo,
+                census_year,
+                profile_store=cens_conv_inst.input_params["profile_store"]
+                if cens_conv_inst.input_params.has_keyword("profile_store")
+                else None,
             )
-            raw_df = pd.concat(
-                [
-                    chunk[
-                        (chunk["GEO_CODE (POR)"].str.find(str(low_res_geo), 0) == 0)
-                        & (chunk["GEO_LEVEL"] == high_res_geo)
-                        & (chunk["CENSUS_YEAR"] == census_year)
-                    ]
-                    for chunk in prof_iter
-                ]
-            )
-            return raw_df
         except Exception as e:
             raise SynthEcoError(
                 "CanadaCensusSummaryPlugin: read_raw_data_into_pandas\n{}".format(e)
@@ -294,27 +276,23 @@ class CanadaCensusSummaryPlugin:
 
                 # Capture case where all variables are 0, right now make them all even cause
                 # I don't know what else to do with them
-                sum_by_geo = sum_df.groupby("GEO_CODE").sum()
-                sum_df["total"] = sum_df.apply(
-                    lambda x: 1.0
-                    if sum_by_geo.loc[x["GEO_CODE"]]["total"] == 0
-                    else x["total"],
-                    axis=1,
-                )
+                sum_by_geo = sum_df.groupby("GEO_CODE")["total"].transform("sum")
+                sum_df["total"] = sum_df["total"].mask(sum_by_geo == 0, 1.0)
                 log("DEBUG", "sum_df_2 {}:\n{}".format(var, sum_df))
 
                 # Handle bad or obfuscated data values
                 population_df = cens_conv_inst.global_tables.data[
                     "total_population_by_geo"
                 ]
-                for index, row in sum_df.iterrows():
-                    pop = population_df.loc[row["GEO_CODE"]]["total"]
-                    if pd.isnull(row["total"]) or (
-                        row["total"] == 0.0
-                        and str(row["DATA_QUALITY_FLAG"]).find("9") == 0
-                    ):
-                        ave = averages.loc[row[var]]["total"]
-                        sum_df.loc[index, "total"] = 0 if pop == 0 else ave / pop
+                pop = sum_df["GEO_CODE"].map(population_df["total"])
+                ave = sum_df[var].map(averages)
+                bad_values = sum_df["total"].isnull() | (
+                    (sum_df["total"] == 0.0)
+                    & sum_df["DATA_QUALITY_FLAG"].astype(str).str.startswith("9")
+                )
+                sum_df["total"] = sum_df["total"].mask(
+                    bad_values, (ave / pop).where(pop != 0, 0.0)
+                )
 
                 log("DEBUG", "sum_df_3 {}:\n{}".format(var, sum_df))
                 log("DEBUG", "pums_ds {}:\n{} ".format(var, pums_ds))
@@ -330,21 +308,36 @@ class CanadaCensusSummaryPlugin:
                     com_keys = common_var_map.keys()
                     sum_df = sum_df.reset_index()
                     sum_df = sum_df.rename(columns={"total": "total_org"})
-                    sum_df["total"] = [np.NaN for x in range(0, sum_df.shape[0])]
-                    sum_df["total"] = sum_df.apply(
-                        lambda x: sum_df[
-                            (sum_df["GEO_CODE"] == x["GEO_CODE"])
-                            & (
-                                sum_df[var].isin(
-                                    common_var_map[str(x[var])]["profile_inds"]
-                                )
-                            )
-                        ]["total_org"].sum()
-                        if str(x[var]) in com_keys
-                        else np.NaN,
-                        axis=1,
+                    # profile category -> common category lookup, a profile
+                    # category can count towards several common ones
+                    cat_map_df = pd.DataFrame(
+                        [
+                            (profile_ind, com_key)
+                            for com_key, com_ds in common_var_map.items()
+                            for profile_ind in com_ds["profile_inds"]
+                        ],
+                        columns=[var, "_com_key"],
+                    )
+                    com_totals = (
+                        sum_df[["GEO_CODE", var, "total_org"]]
+                        .merge(cat_map_df, on=var)
+                        .groupby(["GEO_CODE", "_com_key"])["total_org"]
+                        .sum()
+                        .rename("total")
+                    )
+
+                    # the rows of the common categories take their totals
+                    sum_df = sum_df[sum_df[var].astype(str).isin(com_keys)].copy()
+                    sum_df["_com_key"] = sum_df[var].astype(str)
+                    sum_df = sum_df.merge(
+                        com_totals, how="left", on=["GEO_CODE", "_com_key"]
+                    )
+                    sum_df["total"] = sum_df["total"].fillna(0.0).astype(np.float64)
+                    sum_df = (
+                        sum_df.drop(columns=["_com_key"])
+                        .dropna(axis=0)
+                        .drop(columns=["total_org"])
                     )
-                    sum_df = sum_df.dropna(axis=0).drop(columns=["total_org"])
                 sum_df = sum_df.set_index("GEO_CODE")
                 sum_df.name = "{} Summary Table".format(var)
                 log("DEBUG", "sum_df_4 {}:\n{}".format(var, sum_df))
@@ -455,24 +448,10 @@ class CanadaCensusPUMSPlugin:
                 for x in fitting_variables
                 if cens_conv_inst.metadata_json[x]["pums_type"] == "continuous"
             ]:
-                new_col_name = "{}_m".format(v)
-                processed_data_df[new_col_name] = [
-                    np.NaN for x in range(0, processed_data_df.shape[0])
-                ]
-                lookup = [
-                    (int(i), x["pums_inds"])
-                    for i, x in cens_conv_inst.metadata_json[v][
-                        "common_var_map"
-                    ].items()
-                ]
-                for i, c in lookup:
-                    upper = float(c[1])
-                    lower = float(c[0])
-                    processed_data_df.loc[
-                        (processed_data_df[v] >= lower)
-                        & (processed_data_df[v] <= upper),
-                        new_col_name,
-                    ] = i
+                recoder = CommonVarRecoder(
+                    cens_conv_inst.metadata_json[v]["common_var_map"]
+                )
+                processed_data_df["{}_m".format(v)] = recoder(processed_data_df[v])
             # This for pums categorical to profile categorical
             for v in [
                 x
@@ -481,15 +460,11 @@ class CanadaCensusPUMSPlugin:
             ]:
                 # Since these are categories, we need to make sure that the names are strings
                 processed_data_df = processed_data_df.astype({v: "str"})
-                new_col_name = "{}_m".format(v)
-                processed_data_df[new_col_name] = [
-                    np.NaN for x in range(0, processed_data_df.shape[0])
-                ]
-                lookup = cens_conv_inst.metadata_json[v]["common_var_map"]
-                for i, c in lookup.items():
-                    processed_data_df.loc[
-                        (processed_data_df[v]).isin(c["pums_inds"]), new_col_name
-                    ] = i
+                recoder = CommonVarRecoder(
+                    cens_conv_inst.metadata_json[v]["common_var_map"],
+                    categorical=True,
+                )
+                processed_data_df["{}_m".format(v)] = recoder(processed_data_df[v])
             # Handle Special Variables that have functions associated with them
             special_vars = [
                 x
@@ -541,12 +516,9 @@ class CanadaCensusPUMSPlugin:
         to be used for certain census variables that require additional processing
         """
         if var == "HHSIZE":
-            new_col_name = "{}_m".format(var)
-            hhsize = pums_df.groupby("HH_ID").size()
-            pums_df["HHSIZE_m"] = pums_df.apply(
-                lambda row: hhsize[row["HH_ID"]] if hhsize[row["HH_ID"]] <= 5 else 5,
-                axis=1,
-            )
+            # household sizes of 5 or more are one category
+            hhsize = pums_df.groupby("HH_ID")["HH_ID"].transform("size")
+            pums_df["HHSIZE_m"] = hhsize.clip(upper=5)
         else:
             print("Variable {} is not a special variable")
             raise
@@ -571,7 +543,25 @@ class CanadaCensusBorderPlugin:
             ip = cens_conv_inst.input_params
             border_file = ip["census_input_files"]["border_gml"]
 
-            return gpd.read_file(border_file).to_crs("WGS 84")
+            # the census tracts of the low resolution area share its code as prefix
+            geo_ids = None
+            if cens_conv_inst.global_tables is not None:
+                geo_ids = []
+                for geo_code in cens_conv_inst.global_tables.data["geos_of_interest"]:
+                    geo_ids.append(geo_code)
+                    # transform pads CTUIDs with one decimal with a trailing 0
+                    if geo_code[-3] == "." and geo_code[-1] == "0":
+                        geo_ids.append(geo_code[:-1])
+
+            return read_border_file(
+                border_file,
+                "CTUID",
+                prefixes=[str(ip["census_low_res_geo_unit"])],
+                geo_ids=geo_ids,
+                cache_location=ip["cache_location"]
+                if ip.has_keyword("cache_location")
+                else None,
+            )
 
         except Exception as e:
             raise SynthEcoError(f"CanadaCensusBorder.read raw data error: \n{e}")
@@ -591,11 +581,10 @@ class CanadaCensusBorderPlugin:
             processed_df = cens_conv_inst.raw_data_df.rename(
                 columns={"CTUID": "GEO_UNIT"}
             ).astype({"GEO_UNIT": "str"})
-            processed_df["GEO_UNIT_P"] = processed_df.apply(
-                lambda row: f"{row['GEO_UNIT']}0"
-                if "." in row["GEO_UNIT"][-2]
-                else row["GEO_UNIT"],
-                axis=1,
+            # pad the CTUIDs with one decimal to the two of the GEO_CODEs
+            geo_units = processed_df["GEO_UNIT"]
+            processed_df["GEO_UNIT_P"] = geo_units.where(
+                geo_units.str[-2] != ".", geo_units + "0"
             )
             processed_df = processed_df.drop(columns=["GEO_UNIT"]).rename(
                 columns={"GEO_UNIT_P": "GEO_UNIT"}
@@ -9,7 +9,6 @@ import numpy as np
 import requests_cache
 import time
 import os
-import geopandas as gpd
 
 from requests.exceptions import HTTPError, ConnectionError, Timeout, RequestException
 from requests.adapters import HTTPAdapter
@@ -18,6 +17,9 @@ from datetime import timedelta
 
 from census_converters import hookimpl
 from census_converters.census_converter import CensusConverter
+from census_converters.border_reader import read_border_file
+from census_converters.profile_store import read_us_profile
+from census_converters.recoder import CommonVarRecoder
 from error import SynthEcoError
 from logger import log
 
@@ -94,6 +96,9 @@ class APIManager:
 
 api_manager = APIManager()
 
+# geography columns of the downloaded profile files
+GEO_COLUMNS = ["state", "county", "tract"]
+
 
 def _format_df(data, ip=None, api_vars=None, formulate_geo_code=True):
     """
@@ -130,6 +135,26 @@ def _format_df(data, ip=None, api_vars=None, formulate_geo_code=True):
     return raw_df
 
 
+def _geo_code_from_columns(raw_df):
+    """
+    _geo_code_from_columns
+
+    Helper function that formulates the tract GEO_CODEs of the profile file
+    data from the zero padded state, county and tract columns
+
+    Arguments:
+        - raw_df (DataFrame): the profile data with state, county and tract columns
+
+    returns:
+        Series of the GEO_CODEs
+    """
+    return (
+        raw_df["state"].astype(str).str.zfill(2)
+        + raw_df["county"].astype(str).str.zfill(3)
+        + raw_df["tract"].astype(str).str.zfill(6)
+    )
+
+
 class USCensusGlobalPlugin:
     """
     USCensusGlobalPlugin
@@ -214,23 +239,20 @@ class USCensusGlobalPlugin:
                 f"{low_res_geo_unit}",
                 f"prof_{low_res_geo_unit}.csv",
             )
-            profile_iter = pd.read_csv(
-                profile_csv,
-                iterator=True,
-                usecols=["state", "county", "tract", "DP05_0001E", "DP04_0001E"],
-                chunksize=1000,
-            )
-            raw_df = pd.concat([chunk for chunk in profile_iter])
-            raw_df["GEO_CODE"] = raw_df.apply(
-                lambda x: "".join(
-                    [
-                        str(x["state"]).zfill(2),
-                        str(x["county"]).zfill(3),
-                        str(x["tract"]).zfill(6),
-                    ]
-                ),
-                axis=1,
-            )
+            if ip.has_keyword("profile_store"):
+                raw_df = read_us_profile(
+                    ip["profile_store"],
+                    ip.input_params["census_year"],
+                    low_res_geo_unit,
+                    ["DP05_0001E", "DP04_0001E"],
+                )
+            else:
+                raw_df = pd.read_csv(
+                    profile_csv,
+                    usecols=GEO_COLUMNS + ["DP05_0001E", "DP04_0001E"],
+                    dtype={c: str for c in GEO_COLUMNS},
+                )
+            raw_df["GEO_CODE"] = _geo_code_from_columns(raw_df)
             raw_df = raw_df.set_index("GEO_CODE")
             return raw_df
         except Exception as e:
@@ -316,7 +338,9 @@ class USCensusSummaryPlugin:
             )
         else:
             print("!!!!!!!Using Files Summary")
-            return USCensusSummaryPlugin._read_raw_data_into_pandas_from_file(ip)
+            return USCensusSummaryPlugin._read_raw_data_into_pandas_from_file(
+                ip, metadata_json
+            )
 
     @staticmethod
     def _read_raw_data_into_pandas_from_api(ip, metadata_json):
@@ -344,7 +368,7 @@ class USCensusSummaryPlugin:
         return raw_df
 
     @staticmethod
-    def _read_raw_data_into_pandas_from_file(ip):
+    def _read_raw_data_into_pandas_from_file(ip, metadata_json=None):
         """
         _read_raw_data_into_pandas_from_file
         Private function that reads data from downloaded files.
@@ -352,8 +376,12 @@ class USCensusSummaryPlugin:
 
         The directory structure is {ip.census_data_dir}/{census_year}/Profile/{stateFips}/prof_{stateFips}.csv
 
+        With the metadata only the profile variables of the fitting variables
+        are read, from the profile_store instead of the file if it is given.
+
         Arguments:
             ip: InputParams from a yaml file
+            metadata_json: the census variable metadata
 
         Returns:
             DataFrame with all of the Profile Variables
@@ -370,19 +398,29 @@ class USCensusSummaryPlugin:
                 f"{low_res_geo_unit}",
                 f"prof_{low_res_geo_unit}.csv",
             )
-            profile_iter = pd.read_csv(profile_csv, iterator=True, chunksize=1000)
-            raw_df = pd.concat([chunk for chunk in profile_iter])
-            print("zfilling")
-            raw_df["GEO_CODE"] = raw_df.apply(
-                lambda x: "".join(
-                    [
-                        str(x["state"]).zfill(2),
-                        str(x["county"]).zfill(3),
-                        str(x["tract"]).zfill(6),
-                    ]
-                ),
-                axis=1,
-            )
+            profile_vars = None
+            if metadata_json is not None:
+                profile_vars = [
+                    pv
+                    for v in ip["census_fitting_vars"]
+                    for pv in metadata_json[v]["profile_vars"]
+                ]
+            if ip.has_keyword("profile_store"):
+                raw_df = read_us_profile(
+                    ip["profile_store"],
+                    ip.input_params["census_year"],
+                    low_res_geo_unit,
+                    profile_vars,
+                )
+            else:
+                raw_df = pd.read_csv(
+                    profile_csv,
+                    usecols=None
+                    if profile_vars is None
+                    else GEO_COLUMNS + list(dict.fromkeys(profile_vars)),
+                    dtype={c: str for c in GEO_COLUMNS},
+                )
+            raw_df["GEO_CODE"] = _geo_code_from_columns(raw_df)
             raw_df = raw_df.set_index("GEO_CODE")
             return raw_df
 
@@ -426,13 +464,9 @@ class USCensusSummaryPlugin:
             # handle cases where total is 0 for all indices in common_var_map
             # TODO maybe eliminate them, but that messes with the pums
 
-            sum_by_geo = var_df.groupby("GEO_CODE").sum()
-            var_df["total"] = var_df.apply(
-                lambda x: 1.0  # right now just converts them to 1.0
-                if sum_by_geo.loc[x["GEO_CODE"]]["total"] == 0
-                else x["total"],
-                axis=1,
-            )
+            # right now just converts them to 1.0
+            sum_by_geo = var_df.groupby("GEO_CODE")["total"].transform("sum")
+            var_df["total"] = var_df["total"].mask(sum_by_geo == 0, 1.0)
 
             var_df = var_df.set_index("GEO_CODE")
             var_df["total"] = var_df["total"].astype(np.float64)
@@ -575,23 +609,12 @@ class USCensusPUMSPlugin:
         proc_df = proc_df.fillna(-999999)
         proc_df[pums_vars] = proc_df[pums_vars].astype(np.int64)
 
+        # pums_inds are single indices or index ranges
         for var in pums_vars:
-            new_col_name = f"{var}_m"
-            proc_df[new_col_name] = [np.NaN for _ in range(proc_df.shape[0])]
-
-            lookup = [
-                (int(i), c["pums_inds"])
-                for i, c in cens_conv_inst.metadata_json[var]["common_var_map"].items()
-            ]
-            for i, constraints in lookup:
-                if len(constraints) == 1:  # for single index constraints
-                    proc_df.loc[proc_df[var] == int(constraints[0]), new_col_name] = i
-                elif len(constraints) == 2:  # for index range constraints
-                    lower = int(constraints[0])
-                    upper = int(constraints[1])
-                    proc_df.loc[
-                        (proc_df[var] >= lower) & (proc_df[var] <= upper), new_col_name
-                    ] = i
+            recoder = CommonVarRecoder(
+                cens_conv_inst.metadata_json[var]["common_var_map"]
+            )
+            proc_df[f"{var}_m"] = recoder(proc_df[var])
 
         proc_df = proc_df.rename(columns={x: f"{x}_V" for x in pums_vars}).rename(
             columns={f"{x}_m": x for x in pums_vars}
@@ -687,7 +710,27 @@ class USCensusBorderPlugin:
                 low_res_geo,
                 f"tl_{ip.input_params['census_year']}_{low_res_geo}_tract.shp",
             )
-            return gpd.read_file(border_file).to_crs("WGS 84")
+
+            # GEOID is the state, county and tract code, so only the counties
+            # of the geos of interest need to be read
+            prefixes = None
+            geo_ids = None
+            if cens_conv_inst.global_tables is not None:
+                geo_ids = [
+                    str(g)
+                    for g in cens_conv_inst.global_tables.data["geos_of_interest"]
+                ]
+                prefixes = sorted({g[:5] for g in geo_ids})
+
+            return read_border_file(
+                border_file,
+                "GEOID",
+                prefixes=prefixes,
+                geo_ids=geo_ids,
+                cache_location=ip["cache_location"]
+                if ip.has_keyword("cache_location")
+                else None,
+            )
         except Exception as e:
             raise SynthEcoError(f"USCensusBorder._read_raw_data error: \n{e}")
 
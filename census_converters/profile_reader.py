@@ -0,0 +1,85 @@
+"""
+profile_reader
+
+This module houses the reader of the Canadian census profile data shared by
+the global and summary converter plugins. Both need the same rows of the
+profile file, so it is scanned and filtered once per run and the result is
+kept for the other converter. If the profile data has been ingested into a
+profile store (see ingest.py), the rows are read from the store instead.
+"""
+
+from functools import lru_cache
+import pandas as pd
+from census_converters.profile_store import read_canada_profile
+from logger import log
+
+PROFILE_DTYPES = {
+    "GEO_CODE (POR)": str,
+    "DIM: Profile of Census Tracts (2247)": str,
+}
+
+
+@lru_cache(maxsize=4)
+def _read_profile_data(
+    profile_data_csv, low_res_geo, high_res_geo, census_year, profile_store
+):
+    """
+    _read_profile_data
+
+    Memoized read of the profile data, see read_profile_data
+    """
+    if profile_store is not None:
+        log("INFO", f"profile_reader: reading the profile store {profile_store}")
+        return read_canada_profile(
+            profile_store, low_res_geo, high_res_geo, census_year
+        )
+
+    log("INFO", f"profile_reader: reading {profile_data_csv}")
+    prof_iter = pd.read_csv(
+        profile_data_csv,
+        iterator=True,
+        dtype=PROFILE_DTYPES,
+        chunksize=100000,
+    )
+    return pd.concat(
+        [
+            chunk[
+                chunk["GEO_CODE (POR)"].str.startswith(str(low_res_geo), na=False)
+                & (chunk["GEO_LEVEL"] == high_res_geo)
+                & (chunk["CENSUS_YEAR"] == census_year)
+            ]
+            for chunk in prof_iter
+        ]
+    )
+
+
+def read_profile_data(
+    profile_data_csv, low_res_geo, high_res_geo, census_year, profile_store=None
+):
+    """
+    read_profile_data
+
+    Reads the rows of the census profile file for the geographic areas within
+    low_res_geo at the high_res_geo level of census_year. The file is only
+    scanned on the first call with a set of arguments, later calls get a copy
+    of the rows that were kept. With a profile store only the partitions of
+    the area are read and the CSV is not opened.
+
+    Arguments:
+        profile_data_csv: the census profile CSV file
+        low_res_geo: the prefix of the GEO_CODEs to keep, e.g. the CMA
+        high_res_geo: the GEO_LEVEL to keep
+        census_year: the CENSUS_YEAR to keep
+        profile_store: the directory of the ingested profile store, None to
+                       read the CSV
+
+    Returns:
+        DataFrame of the kept rows of the profile file
+    """
+    return _read_profile_data(
+        str(profile_data_csv),
+        low_res_geo,
+        high_res_geo,
+        census_year,
+        None if profile_store is None else str(profile_store),
+    ).copy()
@@ -0,0 +1,229 @@
+"""
+profile_store
+
+This module houses the columnar store of the census profile data. The
+profile CSVs are converted once by ingest.py into Parquet datasets that only
+keep the columns the converters use and are partitioned by geography, so the
+converters can read the rows of one area without scanning the whole file.
+
+The layout of the store is
+
+    {store}/canada/GEO_LEVEL={level}/CMA={cma}/*.parquet
+    {store}/us/census_year={year}/state_fips={state}/*.parquet
+"""
+
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from logger import log
+
+CANADA_PROFILE_COLUMNS = {
+    "CENSUS_YEAR": "int64",
+    "GEO_CODE (POR)": "str",
+    "GEO_LEVEL": "int64",
+    "GEO_NAME": "str",
+    "DATA_QUALITY_FLAG": "int64",
+    "DIM: Profile of Census Tracts (2247)": "str",
+    "Member ID: Profile of Census Tracts (2247)": "int64",
+    "Dim: Sex (3): Member ID: [1]: Total - Sex": "str",
+}
+
+CANADA_PARTITIONING = ds.partitioning(
+    pa.schema([("GEO_LEVEL", pa.int64()), ("CMA", pa.string())]), flavor="hive"
+)
+
+US_GEO_COLUMNS = ["state", "county", "tract"]
+
+US_PARTITIONING = ds.partitioning(
+    pa.schema([("census_year", pa.int64()), ("state_fips", pa.string())]),
+    flavor="hive",
+)
+
+
+def dataset_dir(store, census_converter, census_year=None, state=None):
+    """
+    dataset_dir
+
+    Arguments:
+        store: the directory of the profile store
+        census_converter: canada or us
+        census_year: the year of the census data, only for us
+        state: the state FIPS code, only for us
+
+    Returns:
+        the directory of the dataset of the census_converter in the store, for
+        us the partition of the year and state
+    """
+    if census_converter == "canada":
+        return os.path.join(store, "canada")
+    return os.path.join(
+        store, "us", f"census_year={census_year}", f"state_fips={state}"
+    )
+
+
+def ingest_canada_profile(profile_data_csv, store, chunksize=100000):
+    """
+    ingest_canada_profile
+
+    Converts the Canadian census profile CSV into the canada dataset of the
+    store, replacing it if it exists. The CMA partition is the first three
+    digits of the GEO_CODE.
+
+    Arguments:
+        profile_data_csv: the census profile CSV file
+        store: the directory of the profile store
+        chunksize: the number of rows converted at a time
+
+    Returns:
+        the number of rows written
+    """
+    canada_dir = dataset_dir(store, "canada")
+    if os.path.exists(canada_dir):
+        shutil.rmtree(canada_dir)
+    os.makedirs(canada_dir)
+
+    n_rows = 0
+    prof_iter = pd.read_csv(
+        profile_data_csv,
+        usecols=list(CANADA_PROFILE_COLUMNS.keys()),
+        dtype=CANADA_PROFILE_COLUMNS,
+        chunksize=chunksize,
+    )
+    for i, chunk in enumerate(prof_iter):
+        chunk["CMA"] = chunk["GEO_CODE (POR)"].str[:3]
+        ds.write_dataset(
+            pa.Table.from_pandas(chunk, preserve_index=False),
+            canada_dir,
+            format="parquet",
+            partitioning=CANADA_PARTITIONING,
+            basename_template=f"part-{i}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        n_rows += chunk.shape[0]
+    log("INFO", f"profile_store: wrote {n_rows} rows of {profile_data_csv}")
+    return n_rows
+
+
+def ingest_us_profile(profile_csv, store, census_year, state, metadata_json):
+    """
+    ingest_us_profile
+
+    Converts the US census profile CSV of a state into its partition of the us
+    dataset of the store, replacing the partition if it exists. Only the geo
+    columns and the profile variables of the metadata are kept.
+
+    Arguments:
+        profile_csv: the prof_{state}.csv file
+        store: the directory of the profile store
+        census_year: the year of the census data
+        state: the state FIPS code
+        metadata_json: the US census variable metadata
+
+    Returns:
+        the number of rows written
+    """
+    partition_dir = dataset_dir(store, "us", census_year, state)
+    if os.path.exists(partition_dir):
+        shutil.rmtree(partition_dir)
+    os.makedirs(partition_dir)
+
+    profile_vars = ["DP05_0001E", "DP04_0001E"]
+    for var_ds in metadata_json.values():
+        if isinstance(var_ds, dict) and "profile_vars" in var_ds:
+            profile_vars.extend(
+                v for v in var_ds["profile_vars"] if v not in profile_vars
+            )
+
+    prof_df = pd.read_csv(profile_csv, usecols=US_GEO_COLUMNS + profile_vars)
+    prof_df.to_parquet(os.path.join(partition_dir, "part-0.parquet"), index=False)
+    log("INFO", f"profile_store: wrote {prof_df.shape[0]} rows of {profile_csv}")
+    return prof_df.shape[0]
+
+
+def read_canada_profile(store, low_res_geo, high_res_geo, census_year):
+    """
+    read_canada_profile
+
+    Reads the rows of the canada dataset of the store that are within
+    low_res_geo at the high_res_geo level of census_year. Only the matching
+    partitions are opened. The result has the same columns as the filtered
+    profile CSV less the ones the converters do not use.
+
+    Arguments:
+        store: the directory of the profile store
+        low_res_geo: the prefix of the GEO_CODEs to keep, e.g. the CMA
+        high_res_geo: the GEO_LEVEL to keep
+        census_year: the CENSUS_YEAR to keep
+
+    Returns:
+        DataFrame of the kept rows of the profile data
+    """
+    prefix = str(low_res_geo)
+    conditions = {"GEO_LEVEL": int(high_res_geo), "CENSUS_YEAR": int(census_year)}
+    if len(prefix) >= 3:
+        conditions["CMA"] = prefix[:3]
+
+    prof_df = (
+        ds.dataset(
+            os.path.join(store, "canada"),
+            format="parquet",
+            partitioning=CANADA_PARTITIONING,
+        )
+        .to_table(
+            columns=list(CANADA_PROFILE_COLUMNS.keys()),
+            filter=_filter_expression(conditions),
+        )
+        .to_pandas()
+    )
+    return prof_df[prof_df["GEO_CODE (POR)"].str.startswith(prefix)]
+
+
+def read_us_profile(store, census_year, state, profile_vars):
+    """
+    read_us_profile
+
+    Reads the profile data of a state from the us dataset of the store
+
+    Arguments:
+        store: the directory of the profile store
+        census_year: the year of the census data
+        state: the state FIPS code
+        profile_vars: the profile variables to read besides the geo columns,
+                      None for all of them
+
+    Returns:
+        DataFrame with the geo columns and profile_vars of the state
+    """
+    return (
+        ds.dataset(
+            os.path.join(store, "us"), format="parquet", partitioning=US_PARTITIONING
+        )
+        .to_table(
+            columns=None
+            if profile_vars is None
+            else US_GEO_COLUMNS + list(dict.fromkeys(profile_vars)),
+            filter=_filter_expression(
+                {"census_year": int(census_year), "state_fips": str(state)}
+            ),
+        )
+        .to_pandas()
+    )
+
+
+def _filter_expression(conditions):
+    """
+    _filter_expression
+
+    Arguments:
+        conditions: dictionary of column -> value the column has to equal
+
+    Returns:
+        the dataset expression that is the conjunction of the conditions
+    """
+    expression = None
+    for column, value in conditions.items():
+        condition = ds.field(column) == value
+        expression = condition if expression is None else expression & condition
+    return expression
@@ -0,0 +1,86 @@
+"""
+recoder
+
+This module houses the recoder shared by the PUMS converter plugins that maps
+the PUMS values of a fitting variable to the common categories of its
+common_var_map. The map is compiled once into a lookup so a whole column is
+recoded in a single vectorized operation.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class CommonVarRecoder:
+    """
+    CommonVarRecoder
+
+    Recoder for the pums_inds of a common_var_map. The pums_inds of each
+    common category are either a single value, an inclusive [lower, upper]
+    range or, for categorical variables, a list of category names. As with
+    the masked assignments it replaces, when categories overlap the one
+    that comes later in the map wins, and values in no category get NaN.
+    """
+
+    def __init__(self, common_var_map, categorical=False):
+        """
+        Constructor
+
+        Arguments:
+            common_var_map: the common_var_map of the variable metadata
+            categorical: True if the pums_inds are lists of category names,
+                         the common categories are then the keys of the map
+                         rather than their numbers
+
+        Returns:
+            instance
+        """
+        self.categorical = categorical
+        if categorical:
+            self.lookup = {
+                pums_ind: key
+                for key, com_ds in common_var_map.items()
+                for pums_ind in com_ds["pums_inds"]
+            }
+            return
+
+        intervals = []
+        for key, com_ds in common_var_map.items():
+            bounds = [float(x) for x in com_ds["pums_inds"]]
+            intervals.append((bounds[0], bounds[-1], int(key)))
+
+        # the breakpoints split the line into pieces, piece 2 * j + 1 is the
+        # j-th breakpoint itself and piece 2 * j the open interval below it
+        self.breakpoints = np.unique(
+            [bound for lower, upper, _ in intervals for bound in (lower, upper)]
+        )
+        self.codes = np.full(2 * len(self.breakpoints) + 1, np.nan)
+        for lower, upper, code in intervals:
+            first = np.searchsorted(self.breakpoints, lower)
+            last = np.searchsorted(self.breakpoints, upper)
+            self.codes[2 * first + 1 : 2 * last + 2] = code
+
+    def __call__(self, values):
+        """
+        Recodes values to their common categories
+
+        Arguments:
+            values: Series of the PUMS values of the variable
+
+        Returns:
+            Series with the common category of each value, NaN if it has none
+        """
+        if self.categorical:
+            return values.map(self.lookup)
+
+        if len(self.breakpoints) == 0:
+            return pd.Series(np.nan, index=values.index)
+
+        numbers = values.to_numpy(dtype=float)
+        positions = np.searchsorted(self.breakpoints, numbers)
+        on_breakpoint = (
+            self.breakpoints[np.minimum(positions, len(self.breakpoints) - 1)]
+            == numbers
+        )
+        pieces = 2 * positions + on_breakpoint
+        return pd.Series(self.codes[pieces], index=values.index)
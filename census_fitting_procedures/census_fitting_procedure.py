@@ -21,6 +21,14 @@ plugin_map = {
         "module": "census_fitting_procedures.plugins.ipf_census_fitting",
         "class": "IPFCensusHouseholdFittingProcedure",
     },
+    "ipf_numpy": {
+        "module": "census_fitting_procedures.plugins.numpy_ipf_census_fitting",
+        "class": "NumpyIPFCensusHouseholdFittingProcedure",
+    },
+    "ipf_batched": {
+        "module": "census_fitting_procedures.plugins.numpy_ipf_census_fitting",
+        "class": "BatchedIPFCensusHouseholdFittingProcedure",
+    },
     "ipf_sep_p_h": {
         "module": "census_fitting_procedures.plugins.ipt_census_with_separate_p_h_file",
         "class": "IPFCensusHouseholdWithSeparatePHFilesProcedure",
@@ -10,11 +10,324 @@ from ipfn import ipfn
 from census_fitting_procedures import hookimpl
 from logger import log, data_log
 from error import SynthEcoError
-from util import random_round_to_integer
-import random as rn
+from util import integerize_to_total, peak_rss_mb
 import multiprocessing as mp
 import time
 import pickle as pkl
+import hashlib
+import os
+
+# Data that is the same for every geographic area, set once in each pool
+# worker by _init_worker rather than being pickled into every task
+_worker_data = {}
+
+
+def ipfn_fit(
+    pums_freq,
+    summary_geo_tables,
+    fitting_vars,
+    max_iterations,
+    convergence_rate,
+    rate_tolerance,
+):
+    """
+    ipfn_fit
+
+    Runs the ipfn package's DataFrame implementation of IPF for a single
+    geographic area
+
+    Arguments:
+        pums_freq: frequency table of the fitting variable combinations
+        summary_geo_tables: list of marginal series, one per fitting variable
+        fitting_vars: the fitting variables, in the same order as the marginals
+        max_iterations: maximum number of IPF iterations
+        convergence_rate: the convergence rate threshold
+        rate_tolerance: the tolerance on the change in convergence rate
+
+    Returns:
+        tuple of (fitted DataFrame, 1 if converged 0 if not,
+                  DataFrame of the convergence at each iteration)
+    """
+    # ipfn updates the frame it is given in place
+    IPF = ipfn.ipfn(
+        pums_freq.copy(),
+        summary_geo_tables,
+        [[x] for x in fitting_vars],
+        max_iteration=max_iterations,
+        convergence_rate=convergence_rate,
+        rate_tolerance=rate_tolerance,
+        verbose=2,
+    )
+    return IPF.iteration()
+
+
+class HouseholdKernelCache:
+    """
+    HouseholdKernelCache
+
+    Cache of the household selection probabilities for every combination of
+    the fitting variable categories. The distance between a fitted
+    combination and a PUMS household only depends on the household's own
+    combination of categories, so the kernel is held as a
+    (fitted combinations x household combinations) probability matrix along
+    with the household combination of each PUMS row. It does not depend on
+    the geographic area and can be reused by all of them and across runs.
+    """
+
+    def __init__(
+        self,
+        pums,
+        frequency_table,
+        fitting_vars,
+        metadata_json,
+        alpha=0.0,
+        k=0.001,
+        location_=None,
+    ):
+        """
+        Constructor
+
+        Arguments:
+            pums: the categorical PUMS table households are selected from
+            frequency_table: the PUMS frequency table, one row per combination
+                             of the fitting variable categories
+            fitting_vars: the fitting variables
+            metadata_json: the census variable metadata
+            alpha: categorical distance parameter
+            k: ordinal fitting constant
+            location_: directory to persist the cache in, None to not persist
+
+        Returns:
+            instance
+        """
+        self.fitting_vars = list(fitting_vars)
+        self.pums_index = pums.index.to_numpy()
+        self._location = location_
+
+        pums_values = pums[self.fitting_vars].astype(float)
+        fit_values = frequency_table[self.fitting_vars].astype(float)
+        self.digest = HouseholdKernelCache._digest(
+            pums_values, fit_values, self.fitting_vars, metadata_json, alpha, k
+        )
+
+        if not self._load():
+            # number the distinct household combinations
+            grouped = pums_values.groupby(self.fitting_vars, dropna=False, sort=False)
+            self.household_codes = grouped.ngroup().to_numpy()
+            self.household_counts = np.bincount(self.household_codes)
+            first_rows = np.unique(self.household_codes, return_index=True)[1]
+            household_combos = pums_values.iloc[first_rows]
+
+            fit_combos = fit_values.drop_duplicates()
+            self.combo_rows = {
+                c: i
+                for i, c in enumerate(fit_combos.itertuples(index=False, name=None))
+            }
+            self.prob_matrix = HouseholdKernelCache._compute_kernels(
+                fit_combos,
+                household_combos,
+                self.household_counts,
+                self.fitting_vars,
+                metadata_json,
+                alpha,
+                k,
+            )
+            self.save()
+
+        self._build_sampler()
+
+    @staticmethod
+    def _digest(pums_values, fit_values, fitting_vars, metadata_json, alpha, k):
+        """
+        _digest
+
+        Hash of everything the kernels depend on, used to name the persisted cache
+        """
+        sha = hashlib.sha256()
+        sha.update(pd.util.hash_pandas_object(pums_values, index=True).values)
+        sha.update(pd.util.hash_pandas_object(fit_values, index=False).values)
+        sha.update(
+            repr(
+                [
+                    fitting_vars,
+                    [metadata_json[v]["sample_type"] for v in fitting_vars],
+                    alpha,
+                    k,
+                ]
+            ).encode()
+        )
+        return sha.hexdigest()
+
+    @staticmethod
+    def _compute_kernels(
+        fit_combos,
+        household_combos,
+        household_counts,
+        fitting_vars,
+        metadata_json,
+        alpha,
+        k,
+    ):
+        """
+        _compute_kernels
+
+        Computes the probability of selecting each household combination for
+        each fitted combination, which is the distance between the two
+        weighted by the number of households with that combination
+
+        Returns:
+            a (fitted combinations x household combinations) probability matrix
+        """
+        distance_matrix = np.ones((fit_combos.shape[0], household_combos.shape[0]))
+        c_o_d = IPFCensusHouseholdFittingProcedure.calculate_ordinal_distance
+        c_c_d = IPFCensusHouseholdFittingProcedure.calculate_categorical_distance
+        for var in fitting_vars:
+            pums_ds = metadata_json[var]
+            # table values down the rows and pums values across the columns
+            table_values = fit_combos[var].to_numpy()[:, np.newaxis]
+            pums_values = household_combos[var].to_numpy()[np.newaxis, :]
+            # r is the difference between the maximum and minimum value of the fitting var
+            if pums_ds["sample_type"] == "ordinal":
+                r = int(household_combos[var].max()) - int(household_combos[var].min())
+                distance_matrix *= c_o_d(pums_values, table_values, r, k)
+            else:
+                distance_matrix *= c_c_d(pums_values, table_values, 0.0)
+
+        distance_matrix *= household_counts[np.newaxis, :]
+        distance_sums = distance_matrix.sum(axis=1)
+        return distance_matrix / distance_sums[:, np.newaxis]
+
+    def probabilities(self, combo):
+        """
+        probabilities
+
+        Arguments:
+            combo: tuple of the fitting variable values of a fitted row
+
+        Returns:
+            the probability of selecting each PUMS household, in the order of
+            pums_index
+        """
+        combo_prob = self.prob_matrix[self.combo_rows[tuple(float(x) for x in combo)]]
+        return (combo_prob / self.household_counts)[self.household_codes]
+
+    def _build_sampler(self):
+        """
+        _build_sampler
+
+        Precomputes the cumulative weights used by sample. The cumulative
+        rows are offset by their row number and flattened so that a single
+        searchsorted call can draw from any mix of rows.
+        """
+        if not np.isfinite(self.prob_matrix).all():
+            log(
+                "WARN",
+                "There are infinities in the household kernels "
+                + "which could produce erroneous results",
+            )
+        n_rows, n_combos = self.prob_matrix.shape
+        cum = np.cumsum(self.prob_matrix, axis=1)
+        cum /= cum[:, -1:]
+        self._cum_flat = (cum + np.arange(n_rows)[:, np.newaxis]).ravel()
+        # guards against drawing past the last combination with any weight
+        self._last_combo = (
+            n_combos - 1 - np.argmax(self.prob_matrix[:, ::-1] > 0, axis=1)
+        )
+        self._household_order = np.argsort(self.household_codes, kind="stable")
+        self._household_starts = (
+            np.cumsum(self.household_counts) - self.household_counts
+        )
+
+    def sample(self, fit_table, rng):
+        """
+        sample
+
+        Draws the PUMS households for every row of a fitted table at once.
+        A household combination is drawn from the cumulative weights of the
+        row's combination and then a household uniformly among the ones that
+        share it, which gives the same distribution as probabilities.
+
+        Arguments:
+            fit_table: the rounded fitting result with the fitting vars and total
+            rng: numpy Generator to draw with
+
+        Returns:
+            integer array of the selected PUMS indexes
+        """
+        rows = np.array(
+            [
+                self.combo_rows[tuple(float(x) for x in combo)]
+                for combo in fit_table[self.fitting_vars].itertuples(
+                    index=False, name=None
+                )
+            ],
+            dtype=np.int64,
+        )
+        row_draws = np.repeat(rows, fit_table["total"].to_numpy().astype(np.int64))
+
+        n_combos = self.prob_matrix.shape[1]
+        combos = (
+            np.searchsorted(
+                self._cum_flat, rng.random(row_draws.size) + row_draws, side="right"
+            )
+            - row_draws * n_combos
+        )
+        combos = np.minimum(combos, self._last_combo[row_draws])
+        households = self._household_order[
+            self._household_starts[combos]
+            + rng.integers(0, self.household_counts[combos])
+        ]
+        return self.pums_index[households]
+
+    def _cache_file(self):
+        return os.path.join(self._location, f"household_kernels_{self.digest}.pkl")
+
+    def save(self):
+        """
+        save
+
+        Persists the kernels to the cache location if there is one
+
+        Returns:
+            True if the kernels were written
+        """
+        if self._location is None:
+            return False
+        try:
+            os.makedirs(self._location, exist_ok=True)
+            with open(self._cache_file(), "wb") as f:
+                pkl.dump(
+                    {
+                        "household_codes": self.household_codes,
+                        "household_counts": self.household_counts,
+                        "combo_rows": self.combo_rows,
+                        "prob_matrix": self.prob_matrix,
+                    },
+                    f,
+                )
+            return True
+        except Exception as e:
+            raise SynthEcoError(f"HouseholdKernelCache: problem saving the cache:\n{e}")
+
+    def _load(self):
+        """
+        _load
+
+        Reads the persisted kernels if they exist for the current inputs
+
+        Returns:
+            True if the kernels were read
+        """
+        if self._location is None or not os.path.exists(self._cache_file()):
+            return False
+        log("INFO", f"Reading household kernels from {self._cache_file()}")
+        with open(self._cache_file(), "rb") as f:
+            cached = pkl.load(f)
+        self.household_codes = cached["household_codes"]
+        self.household_counts = cached["household_counts"]
+        self.combo_rows = cached["combo_rows"]
+        self.prob_matrix = cached["prob_matrix"]
+        return True
 
 
 class IPFCensusHouseholdFittingProcedure:
@@ -36,6 +349,25 @@ class IPFCensusHouseholdFittingProcedure:
         Arguments:
             fit_proc_inst: instance of the plugin class
 
+        returns a pandas dataFrame that provides the results of the IPF procedure
+        """
+        return IPFCensusHouseholdFittingProcedure._perform_fitting(
+            fit_proc_inst, ipfn_fit
+        )
+
+    @staticmethod
+    def _perform_fitting(fit_proc_inst, ipf_method):
+        """
+        _perform_fitting
+
+        Function that performs the IPF fitting with a given IPF implementation
+        and then selects the households from the fitted results
+
+        Arguments:
+            fit_proc_inst: instance of the plugin class
+            ipf_method: function that performs IPF for one geographic area,
+                        see ipfn_fit for the signature
+
         geo_code: the code fo the geographic unit that you want to fit
         summary_tables: marginal tables for the geographic area corresponding to geo_code
                         There will be one marginal series per the fitting variables
@@ -69,120 +401,240 @@ class IPFCensusHouseholdFittingProcedure:
             num_houses = fit_proc_inst.global_tables.data["number_households_by_geo"]
             summary_tables = fit_proc_inst.summary_tables.data
             pums_freq_org = fit_proc_inst.pums_tables.data["frequency_table"]
-            pums_hier = fit_proc_inst.pums_tables.data["categorical_table"]
-            metadata_json = fit_proc_inst.global_tables.data["census_variable_metadata"]
-            alpha = fit_proc_inst.input_params["ipf_alpha"]
-            K = fit_proc_inst.input_params["ipf_k"]
 
-            fit_res = {}
-            unconverged_geos = []
             fitting_arg_list = []
 
             for geo_code in geo_codes_of_interest:
                 log("DEBUG", f"--IPF--: Beginning processing for geo_code {geo_code}")
                 n_houses = num_houses.loc[geo_code, "total"]
-                summary_geo_tables = []
-                pums_freq = pums_freq_org.copy(deep=True)
-                # Extract the geo_code information from summary Tables
-                for var in fitting_vars:
-                    log("DEBUG", f"--IPF--: Transforming {geo_code} {var}")
-                    sum_t_df = summary_tables[var]
-                    # sum_t_df = sum_t_df.set_index('GEO_CODE')
-
-                    sum_g_df = sum_t_df.loc[geo_code,].reset_index().set_index([var])
-
-                    sum_g_ser = sum_g_df["total"]
-                    sum_g_total = sum_g_ser.sum()
-                    sum_g_ser = sum_g_ser.astype("float64")
-                    sum_g_ser = sum_g_ser.apply(
-                        lambda x: 0
-                        if sum_g_total == 0
-                        else round((x / sum_g_total) * n_houses, 0)
-                    )
-                    summary_geo_tables.append(sum_g_ser)
-
-                # set up a list with all of the function calls that need to be made to the fitting procedure
-                fitting_arg_list.append(
-                    [
-                        geo_code,
-                        summary_geo_tables,
-                        pums_freq,
-                        fitting_vars,
-                        n_houses,
-                        max_iterations,
-                        convergence_rate,
-                        rate_tolerance,
-                    ]
+                summary_geo_tables = IPFCensusHouseholdFittingProcedure._geo_marginals(
+                    summary_tables, fitting_vars, geo_code, n_houses
                 )
+
+                # set up a list with all of the function calls that need to be made to the fitting procedure,
+                # the frequency table and IPF parameters are shared and given to the workers once
+                fitting_arg_list.append([geo_code, summary_geo_tables, n_houses])
+
+            geo_seeds = IPFCensusHouseholdFittingProcedure._geo_seeds(
+                fit_proc_inst, len(fitting_arg_list), 0
+            )
+            for args, geo_seed in zip(fitting_arg_list, geo_seeds):
+                args.append(geo_seed)
+
+            shared_data = {
+                "pums_freq": pums_freq_org,
+                "fitting_vars": fitting_vars,
+                "max_iterations": max_iterations,
+                "convergence_rate": convergence_rate,
+                "rate_tolerance": rate_tolerance,
+                "ipf_method": ipf_method,
+            }
+            log(
+                "INFO",
+                "--IPF--: Peak RSS before fitting (MB) {:.1f}, workers {:.1f}".format(
+                    *peak_rss_mb()
+                ),
+            )
+
             # Parallel execution
             arg_list = [tuple(x) for x in fitting_arg_list]
-            with mp.Pool(fit_proc_inst.input_params["parallel_num_cores"]) as pool:
+            with mp.Pool(
+                fit_proc_inst.input_params["parallel_num_cores"],
+                initializer=IPFCensusHouseholdFittingProcedure._init_worker,
+                initargs=(shared_data,),
+            ) as pool:
                 results_p = pool.map(
                     IPFCensusHouseholdFittingProcedure._perform_fitting_for_geocode_helper,
                     arg_list,
                 )
+            log(
+                "INFO",
+                "--IPF--: Peak RSS after fitting (MB) {:.1f}, workers {:.1f}".format(
+                    *peak_rss_mb()
+                ),
+            )
 
             results = {}
             for x in results_p:
                 results[x[0]] = (x[1], x[2])
 
-            # Post process checking
-            unconverged_geocodes = []
-            post_results = {}
-            for g, r in results.items():
-                if r[0] == 0:
-                    unconverged_geocodes.append(g)
-                post_results[g] = r[1]
-
-            if len(unconverged_geocodes) > 0:
-                log(
-                    "INFO",
-                    f"--IPF--: The following geo_codes did not converge\n{unconverged_geocodes}",
-                )
-                if fit_proc_inst.input_params["ipf_fail_on_nonconvergence"]:
-                    raise SynthEcoError(
-                        "--IPF--: There were unconverged geographic areas"
-                    )
-            else:
-                log("INFO", "--IPF--: All Geographic Areas Converged")
-            t1s = time.time()
-            s_argList = []
+            return IPFCensusHouseholdFittingProcedure._sample_from_fitting_results(
+                fit_proc_inst, results
+            )
 
-            for g, f_dict in post_results.items():
-                s_argList.append(
-                    [pums_hier, f_dict, g, fitting_vars, metadata_json, alpha, K]
-                )
+        except Exception as e:
+            raise SynthEcoError("{}".format(e))
 
-            arg_list = [tuple(x) for x in s_argList]
-            with mp.Pool(fit_proc_inst.input_params["parallel_num_cores"]) as pool:
-                results_p = pool.map(
-                    IPFCensusHouseholdFittingProcedure._select_households_helper,
-                    arg_list,
-                )
+    @staticmethod
+    def _sample_from_fitting_results(fit_proc_inst, results):
+        """
+        _sample_from_fitting_results
 
-            sample_results = {}
-            for g, x in results_p:
-                sample_results[g] = x
-            t2s = time.time()
-            t1 = time.time()
-            # TODO: Move to Main
-            num_cores = fit_proc_inst.input_params["parallel_num_cores"]
+        Checks the convergence of the rounded IPF results, selects the
+        households for every geographic area and gathers the derived PUMS
 
-            new_pums_table = (
-                fit_proc_inst.pums_tables.create_new_pums_table_from_household_ids(
-                    sample_results
-                )
+        Arguments:
+            fit_proc_inst: instance of the plugin class
+            results: dictionary of geo_code -> (1 if converged 0 if not,
+                     rounded fitting DataFrame)
+
+        Returns:
+            dictionary with the "Sample Results" and the "Derived PUMS"
+        """
+        fitting_vars = fit_proc_inst.input_params["census_fitting_vars"]
+        pums_hier = fit_proc_inst.pums_tables.data["categorical_table"]
+        metadata_json = fit_proc_inst.global_tables.data["census_variable_metadata"]
+        alpha = fit_proc_inst.input_params["ipf_alpha"]
+        K = fit_proc_inst.input_params["ipf_k"]
+
+        # Post process checking
+        unconverged_geocodes = []
+        post_results = {}
+        for g, r in results.items():
+            if r[0] == 0:
+                unconverged_geocodes.append(g)
+            post_results[g] = r[1]
+
+        if len(unconverged_geocodes) > 0:
+            log(
+                "INFO",
+                f"--IPF--: The following geo_codes did not converge\n{unconverged_geocodes}",
+            )
+            if fit_proc_inst.input_params["ipf_fail_on_nonconvergence"]:
+                raise SynthEcoError("--IPF--: There were unconverged geographic areas")
+        else:
+            log("INFO", "--IPF--: All Geographic Areas Converged")
+        t1s = time.time()
+        location = (
+            fit_proc_inst.input_params["cache_location"]
+            if fit_proc_inst.input_params.has_keyword("cache_location")
+            else None
+        )
+        kernel_cache = HouseholdKernelCache(
+            pums_hier,
+            fit_proc_inst.pums_tables.data["frequency_table"],
+            fitting_vars,
+            metadata_json,
+            alpha,
+            K,
+            location_=location,
+        )
+        log("INFO", "time to compute kernels {}".format(time.time() - t1s))
+        geo_seeds = IPFCensusHouseholdFittingProcedure._geo_seeds(
+            fit_proc_inst, len(post_results), 1
+        )
+        s_argList = []
+
+        for (g, f_dict), geo_seed in zip(post_results.items(), geo_seeds):
+            s_argList.append([f_dict, g, geo_seed])
+
+        shared_data = {"kernel_cache": kernel_cache}
+
+        arg_list = [tuple(x) for x in s_argList]
+        with mp.Pool(
+            fit_proc_inst.input_params["parallel_num_cores"],
+            initializer=IPFCensusHouseholdFittingProcedure._init_worker,
+            initargs=(shared_data,),
+        ) as pool:
+            results_p = pool.map(
+                IPFCensusHouseholdFittingProcedure._select_households_helper,
+                arg_list,
             )
 
-            t2 = time.time()
+        sample_results = {}
+        for g, x in results_p:
+            sample_results[g] = x
+        t2s = time.time()
+        t1 = time.time()
 
-            log("INFO", "time to sample {}".format(t2s - t1s))
-            log("INFO", "time to create: {}".format(t2 - t1))
+        new_pums_table = (
+            fit_proc_inst.pums_tables.create_new_pums_table_from_household_ids(
+                sample_results
+            )
+        )
 
-            return {"Sample Results": sample_results, "Derived PUMS": new_pums_table}
+        t2 = time.time()
 
-        except Exception as e:
-            raise SynthEcoError("{}".format(e))
+        log("INFO", "time to sample {}".format(t2s - t1s))
+        log("INFO", "time to create: {}".format(t2 - t1))
+
+        return {"Sample Results": sample_results, "Derived PUMS": new_pums_table}
+
+    @staticmethod
+    def _geo_marginals(summary_tables, fitting_vars, geo_code, n_houses):
+        """
+        _geo_marginals
+
+        Extracts the marginals of a geographic area from the summary tables
+        and scales them to the number of households in that area
+
+        Arguments:
+            summary_tables: dictionary of summary tables by fitting variable
+            fitting_vars: the fitting variables
+            geo_code: the geographic area to extract
+            n_houses: the number of households in the geographic area
+
+        Returns:
+            list of marginal series, one per fitting variable
+        """
+        summary_geo_tables = []
+        for var in fitting_vars:
+            log("DEBUG", f"--IPF--: Transforming {geo_code} {var}")
+            sum_t_df = summary_tables[var]
+
+            sum_g_df = (
+                sum_t_df.loc[
+                    geo_code,
+                ]
+                .reset_index()
+                .set_index([var])
+            )
+
+            sum_g_ser = sum_g_df["total"]
+            sum_g_total = sum_g_ser.sum()
+            sum_g_ser = sum_g_ser.astype("float64")
+            sum_g_ser = sum_g_ser.apply(
+                lambda x: 0
+                if sum_g_total == 0
+                else round((x / sum_g_total) * n_houses, 0)
+            )
+            summary_geo_tables.append(sum_g_ser)
+        return summary_geo_tables
+
+    @staticmethod
+    def _geo_seeds(fit_proc_inst, n_geos, stage):
+        """
+        _geo_seeds
+
+        Independent seeds for the random draws of each geographic area, derived
+        from the random_seed input parameter so runs can be reproduced
+
+        Arguments:
+            fit_proc_inst: instance of the plugin class
+            n_geos: number of geographic areas
+            stage: number of the stage drawing, so stages get different streams
+
+        Returns:
+            list of numpy SeedSequence, one per geographic area
+        """
+        seed = (
+            fit_proc_inst.input_params["random_seed"]
+            if fit_proc_inst.input_params.has_keyword("random_seed")
+            else None
+        )
+        return np.random.SeedSequence(seed, spawn_key=(stage,)).spawn(n_geos)
+
+    @staticmethod
+    def _init_worker(shared_data):
+        """
+        _init_worker
+        Pool initializer that stores the data shared by all of the tasks
+        in the worker process
+
+        shared_data: dictionary of the shared data
+        """
+        _worker_data.clear()
+        _worker_data.update(shared_data)
 
     @staticmethod
     def _perform_fitting_for_geocode_helper(args):
@@ -190,9 +642,22 @@ class IPFCensusHouseholdFittingProcedure:
         perform_fitting_for_geocode_helper
         Helper function for parallel execution of the fitting procedure
 
-        args: pass through of the args for the real fucntion
+        args: (geo_code, summary_geo_tables, n_houses, seed), the rest of the
+              arguments for the real function come from _worker_data
         """
-        return IPFCensusHouseholdFittingProcedure._perform_fitting_for_geocode(*args)
+        geo_code, summary_geo_tables, n_houses, seed = args
+        return IPFCensusHouseholdFittingProcedure._perform_fitting_for_geocode(
+            geo_code,
+            summary_geo_tables,
+            _worker_data["pums_freq"],
+            _worker_data["fitting_vars"],
+            n_houses,
+            _worker_data["max_iterations"],
+            _worker_data["convergence_rate"],
+            _worker_data["rate_tolerance"],
+            _worker_data["ipf_method"],
+            seed,
+        )
 
     @staticmethod
     def _perform_fitting_for_geocode(
@@ -204,19 +669,18 @@ class IPFCensusHouseholdFittingProcedure:
         max_iterations,
         convergence_rate,
         rate_tolerance,
+        ipf_method=ipfn_fit,
+        seed=None,
     ):
         log("INFO", "--IPF--: Starting IPF for {}".format(geo_code))
-        IPF = ipfn.ipfn(
+        results = ipf_method(
             pums_freq,
             summary_geo_tables,
-            [[x] for x in fitting_vars],
-            max_iteration=max_iterations,
-            convergence_rate=convergence_rate,
-            rate_tolerance=rate_tolerance,
-            verbose=2,
+            fitting_vars,
+            max_iterations,
+            convergence_rate,
+            rate_tolerance,
         )
-        results = IPF.iteration()
-        log("INFO", "--IPF--: Successfully converged IPF for {}".format(geo_code))
 
         # results tuple: 0 results; 1 (0 if failed to converge 1 if success);
         # 2 is the convergence at each iteration.
@@ -241,76 +705,45 @@ class IPFCensusHouseholdFittingProcedure:
                 f"--IPF--: Geocode {geo_code} converged in {len(results[2])} iterations",
             )
 
-            # Round the floating point answers to integers (will still be floats)
-            results_rounded = results[0].copy()
-            results_rounded["total"] = results_rounded["total"].apply(
-                lambda x: random_round_to_integer(x)
-            )
+        results_rounded = IPFCensusHouseholdFittingProcedure._round_fitting_result(
+            geo_code, results[0], n_houses, np.random.default_rng(seed)
+        )
+        return (geo_code, results[1], results_rounded)
+
+    @staticmethod
+    def _round_fitting_result(geo_code, fitted_df, n_houses, rng=None):
+        """
+        _round_fitting_result
 
-            # elminate the zero entries as they are not important anymore
-            results_rounded = results_rounded[results_rounded["total"] != 0]
+        Rounds the floating point IPF result of a geographic area to integer
+        household counts that sum to the number of households in the area
 
-            log(
-                "DEBUG",
-                "--IPF--: GEO_CODE: {} SUM: {} NHOUSES: {}".format(
-                    geo_code, results_rounded["total"].sum(), n_houses
-                ),
-            )
-            """
-            This is necessary because if the random rounding eliminates all of the houses in
-            a geographic area, we need to do something different.
-            it means that non of the frequencies are above one, so I will assign 1 to the
-            n_house highest answers rather than round
-            """
-            previous_sum = -100000.00
-            if results_rounded["total"].sum() == 0:
-                # If the IPF results in zero (which can happen when there is very
-                # few houses in the area) set the highest fractional answer to 1.0
-                results_rounded = results[0].nlargest(int(n_houses), "total")
-                results_rounded["total"] = results_rounded["total"].apply(lambda x: 1.0)
-            else:
-                # This part ensures that the number of houses in the fitting is consitent
-                # basically if the sum of the results is higher or lower than the number
-                # of households in an area, increment or decrement randomly till we they
-                # are the same
-                while results_rounded["total"].sum() < n_houses:
-                    current_sum = results_rounded["total"].sum()
-                    if current_sum == previous_sum:
-                        raise SynthEcoError(
-                            "--IPF--: There was a problem in IPF rounding"
-                            + " procedure for {}".format(geo_code)
-                        )
-                    random_hh = rn.randint(0, results_rounded.shape[0] - 1)
-                    results_rounded.loc[results_rounded.index[random_hh], "total"] = (
-                        results_rounded.loc[results_rounded.index[random_hh], "total"]
-                        + 1
-                    )
-                    previous_sum = current_sum
-                while results_rounded["total"].sum() > n_houses:
-                    current_sum = results_rounded["total"].sum()
-                    if current_sum == previous_sum:
-                        raise SynthEcoError(
-                            "--IPF--: There was a problem in IPF rounding"
-                            + " procedure for {}".format(geo_code)
-                        )
-                    random_hh = rn.randint(0, results_rounded.shape[0] - 1)
-                    results_rounded.loc[results_rounded.index[random_hh], "total"] = (
-                        results_rounded.loc[results_rounded.index[random_hh], "total"]
-                        - 1
-                    )
-                    results_rounded = results_rounded[results_rounded["total"] != 0]
-                    previous_sum = current_sum
-
-            # We don't need no stinking zeros
-            results_rounded = results_rounded[results_rounded["total"] != 0]
-            log(
-                "DEBUG",
-                "--IPF--: FINAL RESULTS: GEO_CODE: "
-                + " {} SUM: {} NHOUSES: {}".format(
-                    geo_code, results_rounded["total"].sum(), n_houses
-                ),
-            )
-            return (geo_code, results[1], results_rounded)
+        Arguments:
+            geo_code: the geographic area of the result
+            fitted_df: the fitted frequency table with a "total" column
+            n_houses: the number of households in the geographic area
+            rng: numpy Generator used for the rounding
+
+        Returns:
+            the fitted frequency table with integer totals and no zero entries
+        """
+        # Round the floating point answers to integers (will still be floats)
+        # and make them sum to the number of households in the area
+        results_rounded = fitted_df.copy()
+        results_rounded["total"] = integerize_to_total(
+            results_rounded["total"].to_numpy(), n_houses, rng
+        ).astype(float)
+
+        # We don't need no stinking zeros
+        results_rounded = results_rounded[results_rounded["total"] != 0]
+        log(
+            "DEBUG",
+            "--IPF--: FINAL RESULTS: GEO_CODE: "
+            + " {} SUM: {} NHOUSES: {}".format(
+                geo_code, results_rounded["total"].sum(), n_houses
+            ),
+        )
+        return results_rounded
 
     @staticmethod
     def calculate_ordinal_distance(pums_val, tab_val, r, k):
@@ -320,103 +753,77 @@ class IPFCensusHouseholdFittingProcedure:
         calculates the distance between two variables if the range is ordinal
         i.e. the range has some progression and is not "categorical", such as it is a size, or an age range
 
-        pums_val: the value of the fitted variable from pums
-        tab_val: the summary table value
+        pums_val: the value(s) of the fitted variable from pums
+        tab_val: the summary table value(s)
         r:  distance parameter
         k: fitting constant
 
+        The values can be scalars or numpy arrays that broadcast together
+
         Returns:
             ordinal distance between the pums_val and tab_val
         """
-        return 1 - abs((pums_val - tab_val) / r) ** k
+        return 1 - np.abs((pums_val - tab_val) / r) ** k
 
     @staticmethod
     def calculate_categorical_distance(pums_val, tab_val, alpha):
         """
-        Document
+        calculate_categorical_distance
+
+        calculates the distance between two variables if the range is categorical
+
+        pums_val: the value(s) of the fitted variable from pums
+        tab_val: the summary table value(s)
+        alpha: the distance when the values are the same, 1 - alpha otherwise
+
+        The values can be scalars or numpy arrays that broadcast together
+
+        Returns:
+            categorical distance between the pums_val and tab_val
         """
-        return alpha if pums_val == tab_val else 1.0 - alpha
+        return np.where(pums_val == tab_val, alpha, 1.0 - alpha)
 
     @staticmethod
-    def _select_households(
-        pums, fit_table, geo_code, fitting_vars, metadata_json, alpha=0.0, k=0.001
-    ):
+    def _select_households(kernel_cache, fit_table, geo_code, seed=None):
+        """
+        _select_households
+
+        Samples the PUMS households for the fitted table of a geographic area
+
+        Arguments:
+            kernel_cache: the HouseholdKernelCache with the selection probabilities
+            fit_table: the rounded fitting result of the geographic area
+            geo_code: the geographic area
+            seed: seed for the numpy Generator of the geographic area
+
+        Returns:
+            tuple of (geo_code, array of the selected PUMS indexes)
+        """
         try:
             t1 = time.time()
             log("INFO", "Running select households {}".format(geo_code))
-            mat_array = np.array(
-                [1.0 for i in range(0, fit_table.shape[0] * pums.shape[0])]
-            )
-            distance_matrix = mat_array.reshape(fit_table.shape[0], pums.shape[0])
-            c_o_d = IPFCensusHouseholdFittingProcedure.calculate_ordinal_distance
-            c_c_d = IPFCensusHouseholdFittingProcedure.calculate_categorical_distance
-            for var in fitting_vars:
-                pums_ds = metadata_json[var]
-                table_values = fit_table[var]
-                table_values = table_values.astype(float)
-                pums_values = pums[var]
-                pums_values = pums_values.astype(float)
-                # r is the difference between the maximum and minimum value of the fitting var
-                if pums_ds["sample_type"] == "ordinal":
-                    r = int(pums_values.max()) - int(pums_values.min())
-                    for i in range(0, distance_matrix.shape[0]):
-                        table_value = table_values[table_values.index[i]]
-                        distance_tmp = np.array(
-                            [c_o_d(x, table_value, r, k) for x in list(pums_values)]
-                        )
-                    distance_matrix[i] = distance_matrix[i] * distance_tmp
-                else:
-                    for i in range(0, distance_matrix.shape[0]):
-                        table_value = table_values[table_values.index[i]]
-                        distance_tmp = np.array(
-                            [c_c_d(x, table_value, 0.0) for x in list(pums_values)]
-                        )
-                        distance_matrix[i] = distance_matrix[i] * distance_tmp
-
-            distance_sums = distance_matrix.sum(axis=1)
-            prob_matrix = np.apply_along_axis(
-                lambda x: x / distance_sums, 0, distance_matrix
-            )
-            t2 = time.time()
-            t11 = time.time()
-            sample_inds = []
-            for i in range(0, fit_table.shape[0]):
-                t_i = list(fit_table.index)[i]
-                n_samples = int(fit_table.loc[t_i, "total"])
-                prob_row = prob_matrix[i]
-                if (prob_row < 0).any():
-                    log(
-                        "WARNING",
-                        "There are zeros in the probablility row for geocode "
-                        + "{} row {} which could produce erroneous results".format(
-                            geo_code, i
-                        ),
-                    )
-                if (np.isinf(prob_row)).any():
-                    log(
-                        "WARNING",
-                        "There are infinities in the probablility row for geocode "
-                        + "{} row {}which could produce erroneous results".format(
-                            geo_code, i
-                        ),
-                    )
-                inds_samp = pd.Series(pums.index)
-                sample_inds = sample_inds + list(
-                    inds_samp.sample(n_samples, replace=True, weights=prob_row)
-                )
-
-            t12 = time.time()
+            sample_inds = kernel_cache.sample(fit_table, np.random.default_rng(seed))
             log(
                 "INFO",
-                "For Geocode {}, times are {}, {}".format(geo_code, t2 - t1, t12 - t11),
+                "For Geocode {}, time is {}".format(geo_code, time.time() - t1),
             )
 
             return (geo_code, sample_inds)
         except Exception as e:
-            SynthEcoError(
+            raise SynthEcoError(
                 "There was a problem in parallel select_housholds:\n{}".format(e)
             )
 
     @staticmethod
     def _select_households_helper(args):
-        return IPFCensusHouseholdFittingProcedure._select_households(*args)
+        """
+        _select_households_helper
+        Helper function for parallel execution of the household selection
+
+        args: (fit_table, geo_code, seed), the kernel cache for the real
+              function comes from _worker_data
+        """
+        fit_table, geo_code, seed = args
+        return IPFCensusHouseholdFittingProcedure._select_households(
+            _worker_data["kernel_cache"], fit_table, geo_code, seed
+        )
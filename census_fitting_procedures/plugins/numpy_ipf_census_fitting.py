@@ -0,0 +1,412 @@
+"""
+numpy_ipf_census_fitting
+
+This is an implementation of IPF for fitting census data that works on
+integer coded category arrays with numpy rather than through the
+pandas groupby operations of the ipfn package
+"""
+
+import pandas as pd
+import numpy as np
+from census_fitting_procedures import hookimpl
+from census_fitting_procedures.plugins.ipf_census_fitting import (
+    IPFCensusHouseholdFittingProcedure,
+)
+from logger import log
+from error import SynthEcoError
+
+
+def ipf_numpy(
+    seed,
+    codes,
+    marginals,
+    max_iterations=10000,
+    convergence_rate=1.0e-5,
+    rate_tolerance=1.0e-8,
+):
+    """
+    ipf_numpy
+
+    Iterative proportional fitting on integer coded category arrays. Each
+    iteration rakes the weights to every marginal in turn using np.bincount
+    for the marginal sums and a multiplicative update per cell. The stopping
+    criteria are the same as the ipfn package.
+
+    Arguments:
+        seed: array of the seed weights for each cell (combination of categories)
+        codes: list of integer arrays, one per fitting variable, giving the
+               position of each cell's category in the corresponding marginal
+        marginals: list of arrays of the target totals for each fitting variable
+        max_iterations: maximum number of iterations
+        convergence_rate: stop when the maximum relative marginal error is below this
+        rate_tolerance: stop when the convergence changes less than this
+
+    Returns:
+        tuple of (fitted weights, 1 if converged 0 if not,
+                  list of the convergence at each iteration)
+    """
+    weights = np.array(seed, dtype=np.float64)
+    codes = [np.asarray(c, dtype=np.intp) for c in codes]
+    marginals = [np.asarray(m, dtype=np.float64) for m in marginals]
+    sizes = [m.shape[0] for m in marginals]
+    # only categories that are in the seed take part in the convergence check
+    present = [np.bincount(c, minlength=s) > 0 for c, s in zip(codes, sizes)]
+
+    history = []
+    i = 0
+    conv = np.inf
+    old_conv = -np.inf
+    while (
+        i <= max_iterations
+        and conv > convergence_rate
+        and abs(conv - old_conv) > rate_tolerance
+    ):
+        old_conv = conv
+        for c, m, s in zip(codes, marginals, sizes):
+            sums = np.bincount(c, weights=weights, minlength=s)
+            factor = np.divide(m, sums, out=m.copy(), where=sums != 0)
+            weights *= factor[c]
+
+        conv = _max_convergence(weights, codes, marginals, sizes, present)
+        history.append(conv)
+        i += 1
+
+    converged = 1 if i <= max_iterations else 0
+    return weights, converged, history
+
+
+def _max_convergence(weights, codes, marginals, sizes, present):
+    """
+    _max_convergence
+
+    Returns the maximum relative error between the marginal sums of the
+    weights and the target marginals over all of the fitting variables
+    """
+    max_conv = 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for c, m, s, p in zip(codes, marginals, sizes, present):
+            sums = np.bincount(c, weights=weights, minlength=s)
+            rel = np.abs(sums[p] / m[p] - 1.0)
+            rel = rel[~np.isnan(rel)]
+            if rel.shape[0] > 0:
+                max_conv = max(max_conv, rel.max())
+    return max_conv
+
+
+def ipf_numpy_batched(
+    seed,
+    codes,
+    marginals,
+    max_iterations=10000,
+    convergence_rate=1.0e-5,
+    rate_tolerance=1.0e-8,
+):
+    """
+    ipf_numpy_batched
+
+    Iterative proportional fitting of one seed to the marginals of many
+    geographic areas at once. The weights of all of the areas are held in a
+    (n_geos x n_cells) matrix and raked together, each area stops iterating
+    as soon as it meets the same stopping criteria as ipf_numpy.
+
+    Arguments:
+        seed: array of the seed weights for each cell (combination of categories)
+        codes: list of integer arrays, one per fitting variable, giving the
+               position of each cell's category in the corresponding marginal
+        marginals: list of (n_geos x n_categories) arrays of the target totals
+                   for each fitting variable
+        max_iterations: maximum number of iterations
+        convergence_rate: stop when the maximum relative marginal error is below this
+        rate_tolerance: stop when the convergence changes less than this
+
+    Returns:
+        tuple of (fitted (n_geos x n_cells) weights, array of 1 if converged 0 if not,
+                  array of the number of iterations of each geographic area)
+    """
+    seed = np.asarray(seed, dtype=np.float64)
+    codes = [np.asarray(c, dtype=np.intp) for c in codes]
+    marginals = [np.asarray(m, dtype=np.float64) for m in marginals]
+    n_geos = marginals[0].shape[0]
+    sizes = [m.shape[1] for m in marginals]
+    # indicator matrices so that the marginal sums of every area are one matmul
+    indicators = []
+    for c, s in zip(codes, sizes):
+        indicator = np.zeros((c.shape[0], s))
+        indicator[np.arange(c.shape[0]), c] = 1.0
+        indicators.append(indicator)
+    present = [ind.sum(axis=0) > 0 for ind in indicators]
+
+    weights = np.tile(seed, (n_geos, 1))
+    iterations = np.zeros(n_geos, dtype=np.int64)
+    conv = np.full(n_geos, np.inf)
+    old_conv = np.full(n_geos, -np.inf)
+    active = np.ones(n_geos, dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        while active.any():
+            geo_inds = np.flatnonzero(active)
+            w = weights[geo_inds]
+            for c, m, ind in zip(codes, marginals, indicators):
+                sums = w @ ind
+                m_active = m[geo_inds]
+                factor = np.divide(m_active, sums, out=m_active.copy(), where=sums != 0)
+                w *= factor[:, c]
+
+            max_conv = np.zeros(geo_inds.shape[0])
+            for m, ind, p in zip(marginals, indicators, present):
+                rel = np.abs((w @ ind)[:, p] / m[geo_inds][:, p] - 1.0)
+                rel[np.isnan(rel)] = 0.0
+                if rel.shape[1] > 0:
+                    max_conv = np.maximum(max_conv, rel.max(axis=1))
+
+            weights[geo_inds] = w
+            old_conv[geo_inds] = conv[geo_inds]
+            conv[geo_inds] = max_conv
+            iterations[geo_inds] += 1
+            active = (
+                (iterations <= max_iterations)
+                & (conv > convergence_rate)
+                & (np.abs(conv - old_conv) > rate_tolerance)
+            )
+
+    converged = (iterations <= max_iterations).astype(np.int64)
+    return weights, converged, iterations
+
+
+def stack_geo_marginals(summary_tables, fitting_vars, geo_codes, n_houses):
+    """
+    stack_geo_marginals
+
+    Extracts the marginals of many geographic areas from the summary tables
+    as one (n_geos x n_categories) matrix per fitting variable, scaled to the
+    number of households in each area the same way as
+    IPFCensusHouseholdFittingProcedure._geo_marginals
+
+    Arguments:
+        summary_tables: dictionary of summary tables by fitting variable
+        fitting_vars: the fitting variables
+        geo_codes: the geographic areas to extract
+        n_houses: array of the number of households in each geographic area
+
+    Returns:
+        tuple of (list of category indexes, list of marginal matrices)
+    """
+    categories = []
+    marginals = []
+    n_houses = np.asarray(n_houses, dtype=np.float64)
+    for var in fitting_vars:
+        sum_t_df = summary_tables[var].reset_index()
+        sum_t_df = sum_t_df[sum_t_df["GEO_CODE"].isin(geo_codes)]
+        var_cats = pd.Index(pd.unique(sum_t_df[var]))
+        table = (
+            sum_t_df.pivot_table(
+                index="GEO_CODE", columns=var, values="total", aggfunc="sum"
+            )
+            .reindex(index=geo_codes, columns=var_cats)
+            .fillna(0.0)
+            .to_numpy(dtype=np.float64)
+        )
+        totals = table.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = np.round(table / totals * n_houses[:, np.newaxis], 0)
+        scaled[totals[:, 0] == 0] = 0.0
+        categories.append(var_cats)
+        marginals.append(scaled)
+    return categories, marginals
+
+
+def encode_categories(pums_freq, summary_geo_tables, fitting_vars):
+    """
+    encode_categories
+
+    Converts the fitting variable columns of a frequency table into integer
+    codes that index into the marginal series of each variable
+
+    Arguments:
+        pums_freq: frequency table of the fitting variable combinations
+        summary_geo_tables: list of marginal series, one per fitting variable
+        fitting_vars: the fitting variables, in the same order as the marginals
+
+    Returns:
+        tuple of (list of integer code arrays, list of marginal arrays)
+    """
+    codes = []
+    marginals = []
+    for var, marginal in zip(fitting_vars, summary_geo_tables):
+        var_codes = marginal.index.get_indexer(pums_freq[var])
+        if (var_codes < 0).any():
+            missing = pums_freq[var][var_codes < 0].unique()
+            raise SynthEcoError(
+                f"--IPF--: categories {missing} of {var} are not in the marginals"
+            )
+        codes.append(var_codes)
+        marginals.append(marginal.to_numpy(dtype=np.float64))
+    return codes, marginals
+
+
+def numpy_ipf_fit(
+    pums_freq,
+    summary_geo_tables,
+    fitting_vars,
+    max_iterations,
+    convergence_rate,
+    rate_tolerance,
+):
+    """
+    numpy_ipf_fit
+
+    Runs ipf_numpy for a single geographic area, taking and returning the
+    same structures as ipfn_fit so that it can be used in its place
+
+    Arguments:
+        pums_freq: frequency table of the fitting variable combinations
+        summary_geo_tables: list of marginal series, one per fitting variable
+        fitting_vars: the fitting variables, in the same order as the marginals
+        max_iterations: maximum number of IPF iterations
+        convergence_rate: the convergence rate threshold
+        rate_tolerance: the tolerance on the change in convergence rate
+
+    Returns:
+        tuple of (fitted DataFrame, 1 if converged 0 if not,
+                  DataFrame of the convergence at each iteration)
+    """
+    codes, marginals = encode_categories(pums_freq, summary_geo_tables, fitting_vars)
+    weights, converged, history = ipf_numpy(
+        pums_freq["total"].to_numpy(),
+        codes,
+        marginals,
+        max_iterations=max_iterations,
+        convergence_rate=convergence_rate,
+        rate_tolerance=rate_tolerance,
+    )
+    fitted_df = pums_freq.copy()
+    fitted_df["total"] = weights
+    conv_df = pd.DataFrame(
+        {"iteration": range(len(history)), "conv": history}
+    ).set_index("iteration")
+    return fitted_df, converged, conv_df
+
+
+class NumpyIPFCensusHouseholdFittingProcedure:
+    """
+    NumpyIPFCensusHouseholdFittingProcedure
+
+    This class houses the implemented hooks for the iterative proportional
+    fitting procedure for census fitting using the numpy IPF engine
+    """
+
+    @hookimpl
+    def perform_fitting(fit_proc_inst):
+        """
+        perform_fitting
+
+        Function that performs the IPF fitting with the numpy engine, the data
+        must be prepared before calling this function
+
+        Arguments:
+            fit_proc_inst: instance of the plugin class
+
+        returns a pandas dataFrame that provides the results of the IPF procedure
+        """
+        log("INFO", "--IPF--: Using the numpy IPF engine")
+        return IPFCensusHouseholdFittingProcedure._perform_fitting(
+            fit_proc_inst, numpy_ipf_fit
+        )
+
+
+class BatchedIPFCensusHouseholdFittingProcedure:
+    """
+    BatchedIPFCensusHouseholdFittingProcedure
+
+    This class houses the implemented hooks for the iterative proportional
+    fitting procedure for census fitting that fits all of the geographic
+    areas together in batches with the numpy IPF engine
+    """
+
+    @hookimpl
+    def perform_fitting(fit_proc_inst):
+        """
+        perform_fitting
+
+        Function that performs the IPF fitting for batches of geographic areas,
+        the data must be prepared before calling this function
+
+        Arguments:
+            fit_proc_inst: instance of the plugin class
+
+        returns a pandas dataFrame that provides the results of the IPF procedure
+        """
+        log(
+            "INFO",
+            "--IPF--: Beginning Batched Iterative Proportional Fitting Procedure",
+        )
+        try:
+            max_iterations = fit_proc_inst.input_params["ipf_max_iterations"]
+            convergence_rate = fit_proc_inst.input_params["ipf_convergence_rate"]
+            rate_tolerance = fit_proc_inst.input_params["ipf_rate_tolerance"]
+            batch_size = fit_proc_inst.input_params["ipf_batch_size"]
+
+            fitting_vars = fit_proc_inst.input_params["census_fitting_vars"]
+            geo_codes_of_interest = fit_proc_inst.global_tables.data["geos_of_interest"]
+            num_houses = fit_proc_inst.global_tables.data["number_households_by_geo"]
+            summary_tables = fit_proc_inst.summary_tables.data
+            pums_freq = fit_proc_inst.pums_tables.data["frequency_table"]
+
+            geo_seeds = IPFCensusHouseholdFittingProcedure._geo_seeds(
+                fit_proc_inst, len(geo_codes_of_interest), 0
+            )
+            results = {}
+            for start in range(0, len(geo_codes_of_interest), batch_size):
+                geo_codes = list(geo_codes_of_interest[start : start + batch_size])
+                n_houses = num_houses.loc[geo_codes, "total"].to_numpy()
+                log(
+                    "INFO",
+                    f"--IPF--: Starting batched IPF for {len(geo_codes)} geo_codes",
+                )
+
+                categories, marginals = stack_geo_marginals(
+                    summary_tables, fitting_vars, geo_codes, n_houses
+                )
+                codes = []
+                for var, var_cats in zip(fitting_vars, categories):
+                    var_codes = var_cats.get_indexer(pums_freq[var])
+                    if (var_codes < 0).any():
+                        missing = pums_freq[var][var_codes < 0].unique()
+                        raise SynthEcoError(
+                            f"--IPF--: categories {missing} of {var} are not in the marginals"
+                        )
+                    codes.append(var_codes)
+
+                weights, converged, iterations = ipf_numpy_batched(
+                    pums_freq["total"].to_numpy(),
+                    codes,
+                    marginals,
+                    max_iterations=max_iterations,
+                    convergence_rate=convergence_rate,
+                    rate_tolerance=rate_tolerance,
+                )
+
+                for i, geo_code in enumerate(geo_codes):
+                    if converged[i] == 0:
+                        log("INFO", f"--IPF--: Geocode {geo_code} NOT CONVERGED")
+                    else:
+                        log(
+                            "INFO",
+                            f"--IPF--: Geocode {geo_code} converged in {iterations[i]} iterations",
+                        )
+                    fitted_df = pums_freq.copy()
+                    fitted_df["total"] = weights[i]
+                    results[geo_code] = (
+                        converged[i],
+                        IPFCensusHouseholdFittingProcedure._round_fitting_result(
+                            geo_code,
+                            fitted_df,
+                            n_houses[i],
+                            np.random.default_rng(geo_seeds[start + i]),
+                        ),
+                    )
+
+            return IPFCensusHouseholdFittingProcedure._sample_from_fitting_results(
+                fit_proc_inst, results
+            )
+        except Exception as e:
+            raise SynthEcoError("{}".format(e))
@@ -22,7 +22,7 @@ class CensusFittingResult:
                    and future caching
         """
 
-        if not isinstance(converter_, CensusFittingProcedure):
+        if data_ is None and not isinstance(converter_, CensusFittingProcedure):
             raise SynthEcoError(
                 "Trying to initialize CensusFittingResult with "
                 + "plugin on the wrong type {}".format(type(converter_))
@@ -25,7 +25,15 @@ plugin_map = {
     "uniform": {
         "module": "census_household_sampling.plugins.uniform_household_sampling",
         "class": "UniformHouseholdSampling",
-    }
+    },
+    "triangulation": {
+        "module": "census_household_sampling.plugins.triangulation_household_sampling",
+        "class": "TriangulationHouseholdSampling",
+    },
+    "density_weighted": {
+        "module": "census_household_sampling.plugins.density_weighted_household_sampling",
+        "class": "DensityWeightedHouseholdSampling",
+    },
 }
 
 
@@ -0,0 +1,221 @@
+"""
+density_weighted_household_sampling
+
+This is the implementation of household sampling that places the households
+of a geographic area according to a finer grained weight layer, such as
+dissemination blocks with counts or building footprints, rather than
+uniformly over the whole area
+"""
+
+from census_household_sampling import hookimpl
+from census_household_sampling.plugins.uniform_household_sampling import (
+    UniformHouseholdSampling,
+)
+from census_household_sampling.plugins.triangulation_household_sampling import (
+    TriangulatedPolygon,
+    TriangulationHouseholdSampling,
+)
+from logger import log, data_log
+from error import SynthEcoError
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+
+class WeightedPointSampler:
+    """
+    WeightedPointSampler
+
+    Point sampler that draws the households of a geometry from the features
+    of a weight layer that intersect it. Each feature gets the households in
+    proportion to its weight, split by the share of its area that is inside
+    the geometry. Geometries the weight layer does not cover are sampled
+    uniformly, geometries it covers with zero total weight are an error.
+    """
+
+    def __init__(self, weight_gdf, count_column_=None):
+        """
+        Constructor
+
+        Arguments:
+            weight_gdf: GeoDataFrame of the weight layer in the CRS of the borders
+            count_column_: column with the count of each feature, the area of
+                           the features is used when None
+
+        Returns:
+            instance
+        """
+        self.weight_gdf = weight_gdf[weight_gdf.geometry.area > 0]
+        # the spatial index is built once here, in the parent, and reaches the
+        # pool workers with the sampler through the initializer
+        self.sindex = self.weight_gdf.sindex
+        self.count_column = count_column_
+        if count_column_ is None:
+            self.weights = self.weight_gdf.geometry.area.to_numpy()
+            return
+
+        if count_column_ not in self.weight_gdf.columns:
+            raise SynthEcoError(
+                "density_weighted_household_sampling: the weight layer has no "
+                + f"count column {count_column_}"
+            )
+        try:
+            self.weights = self.weight_gdf[count_column_].to_numpy(dtype=float)
+        except (TypeError, ValueError):
+            raise SynthEcoError(
+                "density_weighted_household_sampling: the count column "
+                + f"{count_column_} of the weight layer is not numeric"
+            )
+        n_missing = np.isnan(self.weights).sum()
+        if n_missing > 0:
+            log(
+                "WARN",
+                f"density_weighted_household_sampling: {n_missing} features have "
+                + f"no {count_column_} count, they are given a weight of 0",
+            )
+            self.weights = np.nan_to_num(self.weights, nan=0.0)
+        if (self.weights < 0).any():
+            raise SynthEcoError(
+                "density_weighted_household_sampling: the count column "
+                + f"{count_column_} of the weight layer has negative values"
+            )
+
+    def __call__(self, geometry, n, rng=None):
+        """
+        Draws n points in geometry, see
+        UniformHouseholdSampling._sample_points_in_polygon
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+
+        features = np.sort(self.sindex.query(geometry, predicate="intersects"))
+        pieces = self.weight_gdf.geometry.iloc[features].intersection(geometry)
+        piece_areas = pieces.area.to_numpy()
+        feature_areas = self.weight_gdf.geometry.iloc[features].area.to_numpy()
+        piece_weights = self.weights[features] * piece_areas / feature_areas
+
+        # features that only touch the border do not cover the area
+        if piece_areas.sum() <= 0:
+            log(
+                "DEBUG",
+                "density_weighted_household_sampling: the weight layer does not "
+                + "cover the area, placing households uniformly",
+            )
+            return TriangulatedPolygon(geometry).sample(n, rng)
+        if piece_weights.sum() <= 0:
+            raise SynthEcoError(
+                "density_weighted_household_sampling: the "
+                + f"{self.count_column or 'area'} weights of the weight layer "
+                + "features in the area sum to zero"
+            )
+
+        counts = rng.multinomial(n, piece_weights / piece_weights.sum())
+        x, y = WeightedPointSampler._sample_points_in_pieces(
+            pieces.to_numpy()[counts > 0], counts[counts > 0], rng
+        )
+
+        # mix the pieces so household ids are not grouped by feature
+        order = rng.permutation(n)
+        return x[order], y[order]
+
+    @staticmethod
+    def _sample_points_in_pieces(pieces, counts, rng):
+        """
+        _sample_points_in_pieces
+
+        Batch rejection sampling of uniform points in several small pieces at
+        once. The candidates of each piece are drawn in its bounding box and
+        all of them are tested in one call, only the rejected ones are drawn
+        again.
+
+        Arguments:
+            pieces: array of the (multi)polygons to sample in
+            counts: the number of points of each piece
+            rng: numpy Generator used for the sampling
+
+        Returns:
+            tuple of (x, y) arrays of the points, grouped by piece
+        """
+        pieces = np.asarray(pieces, dtype=object)
+        shapely.prepare(pieces)
+        owners = np.repeat(np.arange(pieces.size), counts)
+        bounds = shapely.bounds(pieces)[owners]
+
+        x = np.empty(owners.size)
+        y = np.empty(owners.size)
+        redraw = np.arange(owners.size)
+        while redraw.size > 0:
+            x[redraw] = rng.uniform(bounds[redraw, 0], bounds[redraw, 2])
+            y[redraw] = rng.uniform(bounds[redraw, 1], bounds[redraw, 3])
+            redraw = redraw[
+                ~shapely.contains_xy(pieces[owners[redraw]], x[redraw], y[redraw])
+            ]
+        return x, y
+
+
+class DensityWeightedHouseholdSampling:
+    """
+    DensityWeightedHouseholdSampling
+
+    This class houses the implemented hooks for sampling households in
+    proportion to a weight layer within each geographic area
+    """
+
+    @hookimpl
+    def sample_households(house_samp_inst):
+        """
+        sample_households
+
+        Function that takes the households in a list and places them on
+        a map
+
+        Arguments:
+            house_samp_inst - instance variable for all of the necessary data
+                              through the plugin (see census_fitting_procedure)
+
+        Returns:
+            A new PUMS file with the geographic coordinates for all of the
+            households
+        """
+        input_params = house_samp_inst.input_params
+        if not input_params.has_keyword("household_weight_layer_file"):
+            log(
+                "WARN",
+                "density_weighted_household_sampling: no household_weight_layer_file "
+                + "given, placing households uniformly",
+            )
+            return UniformHouseholdSampling._sample_households(
+                house_samp_inst,
+                TriangulationHouseholdSampling._sample_points_in_polygon,
+            )
+
+        try:
+            weight_file = input_params["household_weight_layer_file"]
+            count_column = (
+                input_params["household_weight_layer_count_column"]
+                if input_params.has_keyword("household_weight_layer_count_column")
+                else None
+            )
+            log("INFO", f"Reading household weight layer {weight_file}")
+            weight_gdf = gpd.read_file(weight_file)
+            border_tables = house_samp_inst.border_tables
+            if (
+                border_tables.data.crs is not None
+                and weight_gdf.crs != border_tables.data.crs
+            ):
+                weight_gdf = weight_gdf.to_crs(border_tables.data.crs)
+            # only keep the features that touch the loaded borders
+            touching = border_tables.sindex.query(
+                weight_gdf.geometry, predicate="intersects"
+            )[0]
+            weight_gdf = weight_gdf.iloc[np.unique(touching)]
+        except Exception as e:
+            raise SynthEcoError(
+                "density_weighted_household_sampling: problem reading the weight "
+                + "layer\n{}".format(e)
+            )
+
+        return UniformHouseholdSampling._sample_households(
+            house_samp_inst, WeightedPointSampler(weight_gdf, count_column)
+        )
@@ -0,0 +1,361 @@
+"""
+triangulation_household_sampling
+
+This is the implementation of uniform household sampling that triangulates
+the border of each geographic area and draws the points from the triangles,
+so only the draws in the triangles crossing the border can be rejected rather
+than the draws in the whole bounding box of long thin or sparse areas
+"""
+
+from census_household_sampling import hookimpl
+from census_household_sampling.plugins.uniform_household_sampling import (
+    UniformHouseholdSampling,
+)
+from logger import log, data_log
+from error import SynthEcoError
+
+import hashlib
+import os
+import pickle as pkl
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+
+class TriangulatedPolygon:
+    """
+    TriangulatedPolygon
+
+    A (multi)polygon split into the Delaunay triangles of its vertices, with
+    the cumulative area of the triangles so points can be drawn uniformly.
+    The triangles inside the polygon are sampled directly. The triangles the
+    border crosses are kept whole and their points outside the polygon are
+    drawn again, so the points are exactly uniform in the polygon.
+    """
+
+    def __init__(self, geometry):
+        """
+        Constructor
+
+        Arguments:
+            geometry: the (multi)polygon to triangulate
+
+        Returns:
+            instance
+        """
+        self.polygons = np.array(TriangulatedPolygon._polygons(geometry), dtype=object)
+        if self.polygons.size == 0:
+            raise SynthEcoError(
+                "triangulation_household_sampling: cannot triangulate a geometry "
+                + "with no area"
+            )
+        triangles = []
+        owners = []
+        crossing = []
+        for i, polygon in enumerate(self.polygons):
+            polygon_triangles, polygon_crossing = TriangulatedPolygon._triangulate(
+                polygon
+            )
+            triangles.append(polygon_triangles)
+            owners.append(np.full(polygon_crossing.size, i))
+            crossing.append(polygon_crossing)
+
+        self.triangles = np.concatenate(triangles)
+        self.owners = np.concatenate(owners)
+        self.crossing = np.concatenate(crossing)
+        a = self.triangles[:, 0]
+        b = self.triangles[:, 1]
+        c = self.triangles[:, 2]
+        self.areas = 0.5 * np.abs(
+            (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1])
+            - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+        )
+        self.cum_areas = np.cumsum(self.areas)
+
+    @staticmethod
+    def _polygons(geometry):
+        """
+        _polygons
+
+        Returns:
+            the polygons with an area that make up a geometry
+        """
+        if isinstance(geometry, Polygon):
+            return [geometry] if geometry.area > 0 else []
+        if hasattr(geometry, "geoms"):
+            return [p for g in geometry.geoms for p in TriangulatedPolygon._polygons(g)]
+        return []
+
+    @staticmethod
+    def _triangulate(polygon):
+        """
+        _triangulate
+
+        The Delaunay triangles of the vertices of a polygon that overlap it.
+        Only the border segments that are not edges of the triangles can cross
+        them, every other triangle is either inside or outside and its
+        centroid tells which.
+
+        Arguments:
+            polygon: the polygon to triangulate
+
+        Returns:
+            tuple of (array of the triangle vertices with shape (n, 3, 2),
+            boolean array of the triangles the border crosses)
+        """
+        triangles = shapely.get_parts(shapely.delaunay_triangles(polygon))
+        corners = shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3]
+        rings = [shapely.get_coordinates(ring) for ring in shapely.get_rings(polygon)]
+        starts = np.concatenate([ring[:-1] for ring in rings])
+        ends = np.concatenate([ring[1:] for ring in rings])
+
+        # number the vertices so the edges can be compared as pairs of numbers
+        vertices, ids = np.unique(
+            np.concatenate([corners.reshape(-1, 2), starts, ends]),
+            axis=0,
+            return_inverse=True,
+        )
+        ids = ids.reshape(-1)
+        n_corners = corners.shape[0] * 3
+        corner_ids = ids[:n_corners].reshape(-1, 3)
+        start_ids = ids[n_corners : n_corners + starts.shape[0]]
+        end_ids = ids[n_corners + starts.shape[0] :]
+
+        def edge_codes(u, v):
+            return np.minimum(u, v) * vertices.shape[0] + np.maximum(u, v)
+
+        triangle_edges = np.concatenate(
+            [edge_codes(corner_ids[:, i], corner_ids[:, (i + 1) % 3]) for i in range(3)]
+        )
+        missing = ~np.isin(edge_codes(start_ids, end_ids), triangle_edges)
+
+        crossing = np.zeros(corners.shape[0], dtype=bool)
+        if missing.any():
+            segments = shapely.linestrings(
+                np.stack([starts[missing], ends[missing]], axis=1)
+            )
+            crossing[
+                shapely.STRtree(triangles).query(segments, predicate="intersects")[1]
+            ] = True
+
+        centroids = corners.mean(axis=1)
+        shapely.prepare(polygon)
+        inside = shapely.contains_xy(polygon, centroids[:, 0], centroids[:, 1])
+        keep = (inside | crossing) & (shapely.area(triangles) > 0)
+        return corners[keep], crossing[keep]
+
+    def _points_in_triangles(self, chosen, rng):
+        """
+        _points_in_triangles
+
+        Arguments:
+            chosen: the index of the triangle of each point
+            rng: numpy Generator used for the sampling
+
+        Returns:
+            tuple of (x, y) arrays of uniform points in the chosen triangles
+        """
+        a = self.triangles[chosen, 0]
+        b = self.triangles[chosen, 1]
+        c = self.triangles[chosen, 2]
+
+        r1 = rng.random(chosen.size)
+        r2 = rng.random(chosen.size)
+        # reflect the points of the other half of the parallelogram
+        flip = r1 + r2 > 1.0
+        r1[flip] = 1.0 - r1[flip]
+        r2[flip] = 1.0 - r2[flip]
+
+        points = a + r1[:, np.newaxis] * (b - a) + r2[:, np.newaxis] * (c - a)
+        return points[:, 0], points[:, 1]
+
+    def _choose_triangles(self, n, rng):
+        """
+        _choose_triangles
+
+        Returns:
+            the indices of n triangles chosen in proportion to their area
+        """
+        chosen = np.searchsorted(
+            self.cum_areas, rng.random(n) * self.cum_areas[-1], side="right"
+        )
+        return np.minimum(chosen, self.triangles.shape[0] - 1)
+
+    def sample(self, n, rng=None):
+        """
+        sample
+
+        Draws n points uniformly in the polygon, choosing the triangles in
+        proportion to their area and the point in the triangle with uniform
+        barycentric coordinates. The points outside the polygon, which can
+        only be in the triangles the border crosses, are drawn again.
+
+        Arguments:
+            n: number of points
+            rng: numpy Generator used for the sampling
+
+        Returns:
+            tuple of (x, y) arrays of the n points
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        chosen = self._choose_triangles(n, rng)
+        x, y = self._points_in_triangles(chosen, rng)
+
+        # the polygons lose their prepared state when pickled to the workers
+        shapely.prepare(self.polygons)
+        redraw = np.flatnonzero(self.crossing[chosen])
+        while redraw.size > 0:
+            outside = ~shapely.contains_xy(
+                self.polygons[self.owners[chosen[redraw]]], x[redraw], y[redraw]
+            )
+            redraw = redraw[outside]
+            chosen[redraw] = self._choose_triangles(redraw.size, rng)
+            x[redraw], y[redraw] = self._points_in_triangles(chosen[redraw], rng)
+            redraw = redraw[self.crossing[chosen[redraw]]]
+        return x, y
+
+
+class TriangulationCache:
+    """
+    TriangulationCache
+
+    The TriangulatedPolygons of the geographic areas by GEO_UNIT, persisted
+    in the cache location so the borders are only triangulated again when
+    they change
+    """
+
+    def __init__(self, location_=None):
+        """
+        Constructor
+
+        Arguments:
+            location_: directory to persist the cache in, None to not persist
+
+        Returns:
+            instance
+        """
+        self._location = location_
+        self.triangulations = {}
+        if self._location is not None and os.path.exists(self._cache_file()):
+            log("INFO", f"Reading triangulations from {self._cache_file()}")
+            with open(self._cache_file(), "rb") as f:
+                self.triangulations = pkl.load(f)
+
+    def _cache_file(self):
+        return os.path.join(self._location, "triangulations.pkl")
+
+    def get(self, geometries):
+        """
+        get
+
+        Arguments:
+            geometries: dictionary of GEO_UNIT -> border geometry
+
+        Returns:
+            dictionary of GEO_UNIT -> TriangulatedPolygon, the areas that are
+            not cached or whose border changed are triangulated and saved
+        """
+        result = {}
+        changed = False
+        for geo_unit, geometry in geometries.items():
+            digest = hashlib.sha256(geometry.wkb).hexdigest()
+            cached = self.triangulations.get(geo_unit)
+            if cached is None or cached[0] != digest:
+                cached = (digest, TriangulatedPolygon(geometry))
+                self.triangulations[geo_unit] = cached
+                changed = True
+            result[geo_unit] = cached[1]
+        if changed:
+            self.save()
+        return result
+
+    def save(self):
+        """
+        save
+
+        Persists the triangulations to the cache location if there is one
+
+        Returns:
+            True if the triangulations were written
+        """
+        if self._location is None:
+            return False
+        try:
+            os.makedirs(self._location, exist_ok=True)
+            with open(f"{self._cache_file()}.tmp", "wb") as f:
+                pkl.dump(self.triangulations, f, protocol=pkl.HIGHEST_PROTOCOL)
+            os.replace(f"{self._cache_file()}.tmp", self._cache_file())
+            return True
+        except Exception as e:
+            raise SynthEcoError(f"TriangulationCache: problem saving the cache:\n{e}")
+
+
+class TriangulationHouseholdSampling:
+    """
+    TriangulationHouseholdSampling
+
+    This class houses the implemented hooks for uniform geographic
+    sampling of households by triangulating the geographic areas
+    """
+
+    @hookimpl
+    def sample_households(house_samp_inst):
+        """
+        sample_households
+
+        Function that takes the households in a list and places them on
+        a map
+
+        Arguments:
+            house_samp_inst - instance variable for all of the necessary data
+                              through the plugin (see census_fitting_procedure)
+
+        Returns:
+            A new PUMS file with the geographic coordinates for all of the
+            households
+        """
+        log("INFO", "Placing households in triangulated geographic areas")
+        input_params = house_samp_inst.input_params
+        cache = TriangulationCache(
+            input_params["cache_location"]
+            if input_params.has_keyword("cache_location")
+            else None
+        )
+        return UniformHouseholdSampling._sample_households(
+            house_samp_inst,
+            TriangulationHouseholdSampling._sample_points_in_triangulation,
+            lambda geo_codes: cache.get(
+                house_samp_inst.border_tables.geometries(geo_codes)
+            ),
+        )
+
+    @staticmethod
+    def _sample_points_in_triangulation(triangulation, n, rng=None):
+        """
+        _sample_points_in_triangulation
+
+        Arguments:
+            triangulation: the TriangulatedPolygon of the geographic area
+            n: number of points
+            rng: numpy Generator used for the sampling
+
+        Returns:
+            tuple of (x, y) arrays of the n points
+        """
+        return triangulation.sample(n, rng)
+
+    @staticmethod
+    def _sample_points_in_polygon(geometry, n, rng=None):
+        """
+        _sample_points_in_polygon
+
+        Arguments:
+            geometry: the (multi)polygon to sample in
+            n: number of points
+            rng: numpy Generator used for the sampling
+
+        Returns:
+            tuple of (x, y) arrays of the n points
+        """
+        return TriangulatedPolygon(geometry).sample(n, rng)
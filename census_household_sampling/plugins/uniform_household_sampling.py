@@ -6,14 +6,14 @@ households within a geographic area
 """
 
 from census_household_sampling import hookimpl
-from logger import log, data_log
 from error import SynthEcoError
 
-import pandas as pd
+import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
 import multiprocessing as mp
-import random as rn
+
+# data shared with the pool workers through the initializer
+_worker_data = {}
 
 
 class UniformHouseholdSampling:
@@ -37,6 +37,31 @@ class UniformHouseholdSampling:
             house_samp_inst - instance variable for all of the necessary data
                               through the plugin (see census_fitting_procedure)
 
+        Returns:
+            A new PUMS file with the geographic coordinates for all of the
+            households
+        """
+        return UniformHouseholdSampling._sample_households(
+            house_samp_inst, UniformHouseholdSampling._sample_points_in_polygon
+        )
+
+    @staticmethod
+    def _sample_households(house_samp_inst, point_sampler, shapes=None):
+        """
+        _sample_households
+
+        Function that places the households of every geographic area with a
+        given point sampler
+
+        Arguments:
+            house_samp_inst - instance variable for all of the necessary data
+                              through the plugin (see census_fitting_procedure)
+            point_sampler - function that draws the points in a geometry, see
+                            _sample_points_in_polygon for the signature
+            shapes - function of the GEO_CODEs that returns the dictionary of
+                     GEO_CODE -> shape the point sampler draws the points in,
+                     the border geometries when None
+
         Returns:
             A new PUMS file with the geographic coordinates for all of the
             households
@@ -50,35 +75,47 @@ class UniformHouseholdSampling:
                 pums_deriv_df = house_samp_inst.fitting_result.data["Derived PUMS"]
 
             pums_deriv_df = pums_deriv_df.sort_values(by=["GEO_CODE", "HH_ID"])
-            border_gdf = house_samp_inst.border_tables.data
 
             hh_df = pums_deriv_df[["HH_ID", "GEO_CODE"]].drop_duplicates()
-            hh_dict = {}
 
+            # hh_df is sorted by GEO_CODE so the coordinates of the areas in
+            # hh_freq order line up with its rows
             hh_freq = hh_df.groupby("GEO_CODE").size()
-            hh_args = []
-            for gc, n in hh_freq.items():
-                gc_border_gdf = border_gdf.loc[border_gdf["GEO_UNIT"] == gc]
-                hh_args.append([gc, gc_border_gdf, n])
-
-            with mp.Manager() as manager:
-                hh_dict_p = manager.dict()
-                argList = [tuple([hh_dict_p] + x) for x in hh_args]
-                with manager.Pool(
-                    house_samp_inst.input_params["parallel_num_cores"]
-                ) as pool:
-                    res = pool.map(
-                        UniformHouseholdSampling._select_house_coordinates_helper,
-                        argList,
-                    )
-                hh_dict = dict(hh_dict_p)
-
-            hh_df["latlon"] = hh_df.apply(
-                lambda x: hh_dict[x["GEO_CODE"]].pop(), axis=1
+            seed = (
+                house_samp_inst.input_params["random_seed"]
+                if house_samp_inst.input_params.has_keyword("random_seed")
+                else None
             )
-            hh_df["longitude"] = hh_df.apply(lambda x: x["latlon"][0], axis=1)
-            hh_df["latitude"] = hh_df.apply(lambda x: x["latlon"][1], axis=1)
-            hh_df = hh_df.drop(columns=["latlon"])
+            # the fitting procedures use the spawn keys 0 and 1 of the seed
+            geo_seeds = np.random.SeedSequence(seed, spawn_key=(2,)).spawn(len(hh_freq))
+            arg_list = [
+                (gc, n, geo_seed)
+                for (gc, n), geo_seed in zip(hh_freq.items(), geo_seeds)
+            ]
+
+            # the borders and the sampler are given to the workers once
+            if shapes is None:
+                shapes = house_samp_inst.border_tables.geometries
+            shared_data = {
+                "geometries": shapes(hh_freq.index),
+                "point_sampler": point_sampler,
+            }
+            with mp.Pool(
+                house_samp_inst.input_params["parallel_num_cores"],
+                initializer=UniformHouseholdSampling._init_worker,
+                initargs=(shared_data,),
+            ) as pool:
+                results = pool.map(
+                    UniformHouseholdSampling._select_house_coordinates_helper,
+                    arg_list,
+                )
+
+            if len(results) > 0:
+                hh_df["longitude"] = np.concatenate([x for gc, x, y in results])
+                hh_df["latitude"] = np.concatenate([y for gc, x, y in results])
+            else:
+                hh_df["longitude"] = np.array([], dtype=float)
+                hh_df["latitude"] = np.array([], dtype=float)
 
             return {"Household Geographic Assignments": hh_df}
 
@@ -87,26 +124,111 @@ class UniformHouseholdSampling:
                 "uniform_household_sampling:sample_households\n{}".format(e)
             )
 
+    @staticmethod
+    def _init_worker(shared_data):
+        """
+        _init_worker
+
+        Pool initializer that stores the data shared by all of the geographic
+        areas in the worker
+        """
+        _worker_data.clear()
+        _worker_data.update(shared_data)
+
     @staticmethod
     def _select_house_coordinates_helper(args):
         """
         _select_households_helper
         Helper function for parallel execution of the random coordinate selector
+
+        args: (geo_code, n, seed), the borders and the point sampler come
+              from _worker_data
         """
-        return UniformHouseholdSampling._select_house_coordinates(*args)
+        geo_code, n, seed = args
+        return UniformHouseholdSampling._select_house_coordinates(
+            geo_code,
+            _worker_data["geometries"][geo_code],
+            n,
+            _worker_data["point_sampler"],
+            np.random.default_rng(seed),
+        )
 
     @staticmethod
-    def _select_house_coordinates(hh_dict, geo_code, border_gdf, n):
-        geocode_gdf = border_gdf.loc[border_gdf["GEO_UNIT"] == geo_code]
-        coords = []
-        while len(coords) < n:
-            random_point = Point(
-                rn.uniform(geocode_gdf.bounds["minx"], geocode_gdf.bounds["maxx"]),
-                rn.uniform(geocode_gdf.bounds["miny"], geocode_gdf.bounds["maxy"]),
+    def _select_house_coordinates(geo_code, geometry, n, point_sampler=None, rng=None):
+        """
+        _select_house_coordinates
+
+        Uniformly places n households in the border of a geographic area
+
+        Arguments:
+            geo_code: the geographic area
+            geometry: the border geometry of the geographic area
+            n: number of households to place
+            point_sampler: function that draws the points in a geometry,
+                           _sample_points_in_polygon by default
+            rng: numpy Generator used for the sampling
+
+        Returns:
+            tuple of (geo_code, x array, y array)
+        """
+        if point_sampler is None:
+            point_sampler = UniformHouseholdSampling._sample_points_in_polygon
+        try:
+            x, y = point_sampler(geometry, n, rng)
+        except SynthEcoError as e:
+            raise SynthEcoError(
+                "uniform_household_sampling: cannot place the households of "
+                + f"{geo_code}\n{e}"
             )
-            g_test = geocode_gdf["geometry"].contains(random_point)
-            g_test.index = ["0"]
-            if g_test[0]:
-                coords.append((random_point.x, random_point.y))
+        return geo_code, x, y
+
+    @staticmethod
+    def _sample_points_in_polygon(geometry, n, rng=None, max_batch_size=1000000):
+        """
+        _sample_points_in_polygon
+
+        Batch rejection sampling of uniform points in a polygon. Candidates are
+        drawn in the bounding box in batches sized from the ratio of the polygon
+        area to the bounding box area, tested all at once and only the deficit
+        is drawn again.
+
+        Arguments:
+            geometry: the (multi)polygon to sample in
+            n: number of points
+            rng: numpy Generator used for the sampling
+            max_batch_size: largest number of candidates drawn at once
 
-        hh_dict[geo_code] = coords
+        Returns:
+            tuple of (x, y) arrays of the n points
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        minx, miny, maxx, maxy = geometry.bounds
+        bbox_area = (maxx - minx) * (maxy - miny)
+        if geometry.area <= 0 or bbox_area <= 0:
+            raise SynthEcoError(
+                "uniform_household_sampling: cannot sample points in a geometry "
+                + "with no area"
+            )
+        fill_ratio = geometry.area / bbox_area
+
+        x = np.empty(n)
+        y = np.empty(n)
+        n_accepted = 0
+        while n_accepted < n:
+            deficit = n - n_accepted
+            batch_size = min(
+                int(np.ceil(1.1 * deficit / fill_ratio)) + 16, max_batch_size
+            )
+            cand_x = rng.uniform(minx, maxx, batch_size)
+            cand_y = rng.uniform(miny, maxy, batch_size)
+            # querying a spatial index of the candidates with the polygon tests
+            # them all against the polygon prepared once
+            candidates = gpd.GeoSeries(gpd.points_from_xy(cand_x, cand_y))
+            inside = np.sort(candidates.sindex.query(geometry, predicate="contains"))
+            accepted = min(inside.size, deficit)
+            x[n_accepted : n_accepted + accepted] = cand_x[inside[:accepted]]
+            y[n_accepted : n_accepted + accepted] = cand_y[inside[:accepted]]
+            n_accepted += accepted
+
+        return x, y
@@ -30,7 +30,7 @@ class CensusHouseholdSamplingResult:
                    existing data
         """
 
-        if not isinstance(sampling_proc_, CensusHouseholdSampling):
+        if data_ is None and not isinstance(sampling_proc_, CensusHouseholdSampling):
             raise SynthEcoError(
                 "Trying to initilize CensusHousholdSamplingResult with "
                 + "plugin of the wrong type {}".format(type(sampling_proc_))
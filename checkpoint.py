@@ -0,0 +1,366 @@
+"""
+checkpoint
+
+This module houses the checkpointing of the stages of a syntheco run. The
+result of each stage is written to a run directory together with a key that
+is a hash of the input parameters and source files of the stage and of the
+keys of the stages it depends on, so a resumed run can skip every stage whose
+inputs have not changed since its checkpoint was written.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import pandas as pd
+from census_converters.profile_store import dataset_dir
+from logger import log
+from util import file_hash
+
+# the inputs of each stage, a change in any of them or in a parent stage
+# invalidates its checkpoint. files are the census_input_files or keywords of
+# the source files, census_data the subdirectory of the census_data_dir of the
+# low res geo unit the US converters read, store whether the profile_store
+# dataset is read and api whether the stage reads the census API if it is used
+GEO_PARAMS = [
+    "census_converter",
+    "census_year",
+    "census_high_res_geo_unit",
+    "census_low_res_geo_unit",
+    "census_data_dir",
+    "use_census_api",
+    "profile_store",
+]
+
+STAGE_INPUTS = {
+    "global": {
+        "parents": [],
+        "params": GEO_PARAMS + ["debug_limit_geo_codes"],
+        "files": ["profile_data_csv"],
+        "census_data": "Profile",
+        "store": True,
+        "api": True,
+    },
+    "summary": {
+        "parents": ["global"],
+        "params": GEO_PARAMS + ["census_fitting_vars"],
+        "files": ["profile_data_csv"],
+        "census_data": "Profile",
+        "store": True,
+        "api": True,
+    },
+    "pums": {
+        "parents": [],
+        "params": GEO_PARAMS + ["census_fitting_vars"],
+        "files": ["pums_h_csv", "pums_p_csv"],
+        "census_data": "PUMS",
+        "store": False,
+        "api": True,
+    },
+    "fitting": {
+        "parents": ["global", "summary", "pums"],
+        "params": [
+            "census_fitting_procedure",
+            "ipf_max_iterations",
+            "ipf_fail_on_nonconvergence",
+            "ipf_convergence_rate",
+            "ipf_rate_tolerance",
+            "ipf_alpha",
+            "ipf_k",
+            "random_seed",
+        ],
+        "files": [],
+        "census_data": None,
+        "store": False,
+        "api": False,
+    },
+    "sampling": {
+        "parents": ["global", "fitting"],
+        "params": [
+            "census_household_sampling_procedure",
+            "household_weight_layer_count_column",
+            "random_seed",
+        ],
+        "files": ["border_gml", "household_weight_layer_file"],
+        "census_data": "Borders",
+        "store": False,
+        "api": False,
+    },
+}
+
+
+def _frame_names(data, path=()):
+    """
+    _frame_names
+
+    The names given to the DataFrames of a stage result are not pickled with
+    them, this collects them so they can be restored
+
+    Arguments:
+        data: the data of a stage result, DataFrames in nested dictionaries
+        path: the keys leading to data
+
+    Returns:
+        list of (keys, name) of the named DataFrames
+    """
+    if isinstance(data, pd.DataFrame):
+        return [(path, data.name)] if "name" in data.__dict__ else []
+    if isinstance(data, dict):
+        return [
+            named
+            for key, value in data.items()
+            for named in _frame_names(value, path + (key,))
+        ]
+    return []
+
+
+class RunCheckpoints:
+    """
+    RunCheckpoints
+
+    Class that writes and reads the stage checkpoints of a run directory
+    """
+
+    def __init__(self, input_params, run_dir_=None, resume_=False):
+        """
+        Constructor
+
+        Arguments:
+            input_params: the InputParams of the run
+            run_dir_: the directory of the checkpoints, None to not checkpoint
+            resume_: True to read the valid checkpoints instead of rerunning
+                     their stages
+
+        Returns:
+            instance
+        """
+        self.input_params = input_params
+        self.run_dir = run_dir_
+        self.resume = resume_
+        self._keys = {}
+        self._file_hashes = {}
+        self._data_hashes = {}
+        # the (size, mtime) stamps and hashes of the source files of earlier
+        # runs, so a file is only hashed again when its stamp changes
+        self._stamps = {}
+        self._stamps_changed = False
+        if self.run_dir is not None:
+            os.makedirs(self.run_dir, exist_ok=True)
+            try:
+                with open(self._stamps_file(), "r") as f:
+                    self._stamps = json.load(f)
+            except (OSError, ValueError):
+                self._stamps = {}
+
+    def key(self, stage):
+        """
+        key
+
+        The key of a stage that reads the census API includes the hash of the
+        data it read this run, as the responses are not source files
+
+        Arguments:
+            stage: the name of the stage, one of STAGE_INPUTS
+
+        Returns:
+            the hex key of the inputs of the stage
+        """
+        if stage not in self._keys:
+            ip = self.input_params
+            inputs = STAGE_INPUTS[stage]
+            description = {
+                "stage": stage,
+                "parents": [self.key(parent) for parent in inputs["parents"]],
+                "params": {p: ip[p] for p in inputs["params"] if ip.has_keyword(p)},
+                "files": {
+                    name: self._file_hash(file_name)
+                    for name, file_name in self._source_files(stage).items()
+                },
+            }
+            if self._reads_api(stage):
+                description["data"] = self._data_hashes.get(stage)
+            self._keys[stage] = hashlib.sha256(
+                json.dumps(description, sort_keys=True, default=str).encode()
+            ).hexdigest()
+        return self._keys[stage]
+
+    def _reads_api(self, stage):
+        """
+        _reads_api
+
+        Returns:
+            True if the stage reads its data from the census API this run
+        """
+        ip = self.input_params
+        return (
+            STAGE_INPUTS[stage]["api"]
+            and ip.has_keyword("use_census_api")
+            and bool(ip["use_census_api"])
+        )
+
+    def _source_files(self, stage):
+        """
+        _source_files
+
+        Arguments:
+            stage: the name of the stage
+
+        Returns:
+            dictionary of name -> file name of every source file of the stage
+            that exists, the files in directories are named by their path
+        """
+        ip = self.input_params
+        inputs = STAGE_INPUTS[stage]
+        input_files = (
+            ip["census_input_files"] if ip.has_keyword("census_input_files") else {}
+        )
+        files = {}
+        for name in inputs["files"]:
+            if name in input_files:
+                files[name] = input_files[name]
+            elif ip.has_keyword(name):
+                files[name] = ip[name]
+
+        directories = []
+        if inputs["census_data"] is not None and ip.has_keyword("census_data_dir"):
+            directories.append(
+                os.path.join(
+                    ip["census_data_dir"],
+                    str(ip["census_year"]),
+                    inputs["census_data"],
+                    str(ip["census_low_res_geo_unit"]),
+                )
+            )
+        if inputs["store"] and ip.has_keyword("profile_store"):
+            directories.append(
+                dataset_dir(
+                    ip["profile_store"],
+                    ip["census_converter"],
+                    ip["census_year"],
+                    ip["census_low_res_geo_unit"],
+                )
+            )
+        for directory in directories:
+            for root, dirs, names in os.walk(directory):
+                dirs.sort()
+                for name in sorted(names):
+                    file_name = os.path.join(root, name)
+                    files[file_name] = file_name
+        return files
+
+    def _file_hash(self, file_name):
+        """
+        _file_hash
+
+        Returns:
+            the hash of a source file, each file is only hashed once per run
+            and not at all if its size and modification time are those of
+            the stamp of an earlier run
+        """
+        if file_name not in self._file_hashes:
+            path = os.path.abspath(file_name)
+            stat = os.stat(path)
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            cached = self._stamps.get(path)
+            if cached is None or cached[:2] != stamp:
+                cached = stamp + [file_hash(path)]
+                self._stamps[path] = cached
+                self._stamps_changed = True
+            self._file_hashes[file_name] = cached[2]
+        return self._file_hashes[file_name]
+
+    def _stamps_file(self):
+        return os.path.join(self.run_dir, "file_hashes.json")
+
+    def _save_stamps(self):
+        """
+        _save_stamps
+
+        Writes the stamps and hashes of the source files to the run directory
+        """
+        if not self._stamps_changed:
+            return
+        with open(f"{self._stamps_file()}.tmp", "w") as f:
+            json.dump(self._stamps, f)
+        os.replace(f"{self._stamps_file()}.tmp", self._stamps_file())
+        self._stamps_changed = False
+
+    def _paths(self, stage):
+        """
+        _paths
+
+        Returns:
+            the checkpoint file and the key file of a stage
+        """
+        return (
+            os.path.join(self.run_dir, f"{stage}.pkl"),
+            os.path.join(self.run_dir, f"{stage}.key"),
+        )
+
+    def load(self, stage):
+        """
+        load
+
+        Arguments:
+            stage: the name of the stage
+
+        Returns:
+            the checkpointed data of the stage if resuming and its checkpoint is
+            valid, None otherwise
+        """
+        if self.run_dir is None or not self.resume:
+            return None
+        if self._reads_api(stage):
+            log("INFO", f"checkpoint: the {stage} stage reads the census API")
+            return None
+        data_file, key_file = self._paths(stage)
+        if not (os.path.exists(data_file) and os.path.exists(key_file)):
+            log("INFO", f"checkpoint: no checkpoint for the {stage} stage")
+            return None
+        with open(key_file, "r") as f:
+            if f.read().strip() != self.key(stage):
+                log("INFO", f"checkpoint: the {stage} checkpoint is out of date")
+                return None
+        log("INFO", f"checkpoint: resuming the {stage} stage from {data_file}")
+        with open(data_file, "rb") as f:
+            checkpoint = pickle.load(f)
+        data = checkpoint["data"]
+        for path, name in checkpoint["frame_names"]:
+            frame = data
+            for key in path:
+                frame = frame[key]
+            frame.name = name
+        return data
+
+    def save(self, stage, data):
+        """
+        save
+
+        Writes the data of a stage and its key to the run directory, the key
+        is written last so an interrupted write leaves no valid checkpoint.
+        The data of a stage that read the census API is hashed into its key
+        so the stages that depend on it are rerun if it changed.
+
+        Arguments:
+            stage: the name of the stage
+            data: the data of the stage result
+        """
+        if self.run_dir is None:
+            return
+        data_file, key_file = self._paths(stage)
+        if os.path.exists(key_file):
+            os.remove(key_file)
+        checkpoint = pickle.dumps(
+            {"data": data, "frame_names": _frame_names(data)},
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        if self._reads_api(stage):
+            self._data_hashes[stage] = hashlib.sha256(checkpoint).hexdigest()
+            self._keys.pop(stage, None)
+        with open(f"{data_file}.tmp", "wb") as f:
+            f.write(checkpoint)
+        os.replace(f"{data_file}.tmp", data_file)
+        with open(key_file, "w") as f:
+            f.write(self.key(stage))
+        self._save_stamps()
+        log("INFO", f"checkpoint: wrote the {stage} checkpoint {data_file}")
@@ -17,13 +17,22 @@ class GlobalTables:
     of the Syntheco ecosystem generation system.
     """
 
-    def __init__(self, geo_unit_=None, converter_=None):
+    def __init__(self, geo_unit_=None, converter_=None, data_=None):
         """
         Creation operator
+
+        Arguments:
+            geo_unit_: the geographic unit of the tables
+            converter_: the global census converter
+            data_: utility in case one wants to create an instance from
+                   existing data, e.g. a checkpoint
         """
         self.geo_unit = geo_unit_
         self.converter = converter_
-        self.data = self.converter.convert()
+        if data_ is None:
+            self.data = self.converter.convert()
+        else:
+            self.data = data_
 
     def __str__(self):
         """
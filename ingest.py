@@ -0,0 +1,88 @@
+"""
+ingest
+
+This is the command that converts the census profile data into the columnar
+profile store once, so later syntheco runs given the store as profile_store
+read only the columns and areas they need
+
+    python ingest.py canada -p 98-401-X2016043_English_CSV_data.csv -s store
+    python ingest.py us -c census_data_dir -y 2020 --states 10 24 -s store
+"""
+
+import argparse
+import json
+import os
+from census_converters.census_converter import plugin_map
+from census_converters.profile_store import ingest_canada_profile, ingest_us_profile
+from logger import setup_logger, log
+
+
+def main():
+    """
+    main
+
+    Parses the command line and ingests the profile data into the store
+    """
+    parser = argparse.ArgumentParser(description="Synthco Profile Data Ingest")
+    parser.add_argument(
+        "-s", "--store", action="store", required=True, help="The profile store"
+    )
+    parser.add_argument(
+        "-l",
+        "--log_file",
+        action="store",
+        help="The log file",
+        default="syntheco_ingest_log.txt",
+    )
+    subparsers = parser.add_subparsers(dest="census_converter", required=True)
+
+    canada_parser = subparsers.add_parser("canada", help="Canadian census profile")
+    canada_parser.add_argument(
+        "-p",
+        "--profile_data_csv",
+        action="store",
+        required=True,
+        help="The census profile CSV file",
+    )
+
+    us_parser = subparsers.add_parser("us", help="US census profiles")
+    us_parser.add_argument(
+        "-c",
+        "--census_data_dir",
+        action="store",
+        required=True,
+        help="The directory of the downloaded census data",
+    )
+    us_parser.add_argument(
+        "-y", "--census_year", action="store", required=True, type=int
+    )
+    us_parser.add_argument(
+        "--states", action="store", nargs="+", required=True, help="State FIPS codes"
+    )
+
+    args = parser.parse_args()
+    setup_logger(args.log_file, os.devnull)
+    os.makedirs(args.store, exist_ok=True)
+
+    if args.census_converter == "canada":
+        ingest_canada_profile(args.profile_data_csv, args.store)
+    else:
+        metadata_json = json.load(
+            open(plugin_map["us"]["metadata_json"], "r"), parse_int=str
+        )
+        for state in args.states:
+            profile_csv = os.path.join(
+                args.census_data_dir,
+                str(args.census_year),
+                "Profile",
+                f"{state}",
+                f"prof_{state}.csv",
+            )
+            ingest_us_profile(
+                profile_csv, args.store, args.census_year, state, metadata_json
+            )
+    log("INFO", f"Ingested the {args.census_converter} profile data to {args.store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ _schema_specs = {
         "census_fitting_vars": [str],
         "census_fitting_procedure": str,
         Optional("census_household_sampling_procedure", default="None"): str,
+        Optional("household_weight_layer_file"): And(str, os.path.exists),
+        Optional("household_weight_layer_count_column"): str,
         Optional("output_log_file", default="sytheco_out.txt"): str,
         Optional("output_data_log_file", default="syntheco_data_out.txt"): str,
         Optional("output_prefix", default="syntheco_population"): str,
@@ -25,9 +27,12 @@ _schema_specs = {
         Optional("ipf_rate_tolerance", default=1.0e-8): float,
         Optional("ipf_alpha", default=0.0): float,
         Optional("ipf_k", default=0.0001): float,
+        Optional("ipf_batch_size", default=1000): int,
         Optional("debug_limit_geo_codes"): int,
         Optional("parallel_num_cores", default=1): int,
+        Optional("random_seed"): int,
         Optional("cache_location"): str,
+        Optional("profile_store"): And(str, os.path.exists),
     },
     "us": {
         Optional("use_census_api", default=False): bool,
@@ -17,6 +17,7 @@ from summary_data_tables import SummaryDataTables
 from border_tables import BorderTables
 from census_fitting_result import CensusFittingResult
 from census_household_sampling_result import CensusHouseholdSamplingResult
+from checkpoint import RunCheckpoints
 from logger import setup_logger, log, data_log
 
 
@@ -44,8 +45,22 @@ def main():
     parser.add_argument(
         "-d", "--debug", action="store_true", help="Activates debugging output"
     )
+    parser.add_argument(
+        "-r",
+        "--run_dir",
+        action="store",
+        help="The directory to write the stage checkpoints of the run to",
+        default=None,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skips the stages with a valid checkpoint in the run directory",
+    )
 
     args = parser.parse_args()
+    if args.resume and args.run_dir is None:
+        parser.error("--resume requires --run_dir")
 
     ip = InputParams(args.input_file)
 
@@ -70,59 +85,94 @@ def main():
     data_log("----------------------------------------------------------------------")
 
     census_conv = ip["census_converter"]
-
-    log("INFO", "Setting Up Global Converters")
-    glob_table_conv = CensusConverter(ip, census_conv, "global")
-    log("INFO", "Creating Global Tables")
-    global_tables = GlobalTables(
-        geo_unit_=ip["census_high_res_geo_unit"], converter_=glob_table_conv
-    )
+    checkpoints = RunCheckpoints(ip, run_dir_=args.run_dir, resume_=args.resume)
+
+    global_data = checkpoints.load("global")
+    if global_data is None:
+        log("INFO", "Setting Up Global Converters")
+        glob_table_conv = CensusConverter(ip, census_conv, "global")
+        log("INFO", "Creating Global Tables")
+        global_tables = GlobalTables(
+            geo_unit_=ip["census_high_res_geo_unit"], converter_=glob_table_conv
+        )
+        checkpoints.save("global", global_tables.data)
+    else:
+        global_tables = GlobalTables(
+            geo_unit_=ip["census_high_res_geo_unit"], data_=global_data
+        )
 
     log("INFO", "Global Tables Created")
     data_log(f"{global_tables}")
 
-    log("INFO", "Setting Up Border Tables")
-    bord_table_conv = CensusConverter(ip, census_conv, "border")
-    log("INFO", "Border Converter Created")
-    border_tables = BorderTables(
-        geo_unit_=ip["census_high_res_geo_unit"], converter_=bord_table_conv
-    )
-    log("INFO", "Border Tables Created")
-
     log("INFO", "Setting up Census Converters")
-    pums_table_conv = CensusConverter(ip, census_conv, "pums")
-    summary_table_conv = CensusConverter(
-        ip, census_conv, "summary", _global_tables=global_tables
-    )
-    log("INFO", "Creating Census Data Tables")
-    summary_tables = SummaryDataTables(
-        summary_variables_=ip["census_fitting_vars"],
-        geo_unit_=ip["census_high_res_geo_unit"],
-        converter_=summary_table_conv,
-    )
-
-    pums_heir_tables = PUMSDataTables(
-        geo_unit_=ip["census_low_res_geo_unit"], converter_=pums_table_conv
-    )
+    summary_data = checkpoints.load("summary")
+    if summary_data is None:
+        summary_table_conv = CensusConverter(
+            ip, census_conv, "summary", _global_tables=global_tables
+        )
+        log("INFO", "Creating Census Data Tables")
+        summary_tables = SummaryDataTables(
+            summary_variables_=ip["census_fitting_vars"],
+            geo_unit_=ip["census_high_res_geo_unit"],
+            converter_=summary_table_conv,
+        )
+        checkpoints.save("summary", summary_tables.data)
+    else:
+        summary_tables = SummaryDataTables(
+            summary_variables_=ip["census_fitting_vars"],
+            geo_unit_=ip["census_high_res_geo_unit"],
+            data_=summary_data,
+        )
+
+    pums_data = checkpoints.load("pums")
+    if pums_data is None:
+        pums_table_conv = CensusConverter(ip, census_conv, "pums")
+        pums_heir_tables = PUMSDataTables(
+            geo_unit_=ip["census_low_res_geo_unit"], converter_=pums_table_conv
+        )
+        checkpoints.save("pums", pums_heir_tables.data)
+    else:
+        pums_heir_tables = PUMSDataTables(
+            geo_unit_=ip["census_low_res_geo_unit"], data_=pums_data
+        )
     log("INFO", "Done Setting Up Tables")
 
     data_log(f"{pums_heir_tables}")
     data_log(f"{summary_tables}")
 
-    log("INFO", "Performing Census Fitting Procedure")
-    census_fitting_procedure = CensusFittingProcedure(
-        ip, global_tables, pums_heir_tables, summary_tables
-    )
-    census_fitting_result = CensusFittingResult(converter_=census_fitting_procedure)
+    fitting_data = checkpoints.load("fitting")
+    if fitting_data is None:
+        log("INFO", "Performing Census Fitting Procedure")
+        census_fitting_procedure = CensusFittingProcedure(
+            ip, global_tables, pums_heir_tables, summary_tables
+        )
+        census_fitting_result = CensusFittingResult(converter_=census_fitting_procedure)
+        checkpoints.save("fitting", census_fitting_result.data)
+    else:
+        census_fitting_result = CensusFittingResult(data_=fitting_data)
 
     data_log(f"{census_fitting_result}")
-    log("INFO", "Sampling Households from fitting results")
-    census_household_sampling_proc = CensusHouseholdSampling(
-        ip, census_fitting_result, pums_heir_tables, global_tables, border_tables
-    )
-    census_sampling_result = CensusHouseholdSamplingResult(
-        sampling_proc_=census_household_sampling_proc
-    )
+    sampling_data = checkpoints.load("sampling")
+    if sampling_data is None:
+        log("INFO", "Setting Up Border Tables")
+        bord_table_conv = CensusConverter(
+            ip, census_conv, "border", _global_tables=global_tables
+        )
+        log("INFO", "Border Converter Created")
+        border_tables = BorderTables(
+            geo_unit_=ip["census_high_res_geo_unit"], converter_=bord_table_conv
+        ).restrict_to(global_tables.data["geos_of_interest"])
+        log("INFO", "Border Tables Created")
+        log("INFO", "Sampling Households from fitting results")
+        census_household_sampling_proc = CensusHouseholdSampling(
+            ip, census_fitting_result, pums_heir_tables, global_tables, border_tables
+        )
+        census_sampling_result = CensusHouseholdSamplingResult(
+            sampling_proc_=census_household_sampling_proc
+        )
+        checkpoints.save("sampling", census_sampling_result.data)
+    else:
+        census_sampling_result = CensusHouseholdSamplingResult(data_=sampling_data)
     data_log(f"{census_sampling_result}")
 
     output_writer = OutputFormatter(ip, census_fitting_result, census_sampling_result)
@@ -6,9 +6,9 @@ the synthetic ecosystem generation process.
 """
 
 from error import SynthEcoError
+import numpy as np
 import pandas as pd
 import multiprocessing as mp
-from itertools import chain
 
 
 class PUMSDataTables:
@@ -30,6 +30,8 @@ class PUMSDataTables:
             self.data = self.converter.convert()
         else:
             self.data = data_
+        # HH_ID row indexes of the tables used by the gather functions
+        self._household_row_index = {}
 
     def __str__(self):
         """
@@ -116,33 +118,83 @@ class PUMSDataTables:
         pums_hier_org_df = self.data["raw_data"]
         pums_hier_proc_df = self.data["categorical_table"]
 
-        index_dict = {}
-        geo_list = []
-        overall_hh_ind = []
-        hh_counter = 1
-        for g, hh_inds in hh_inds_by_geo.items():
-            ind_list = []
-            for i in hh_inds:
-                hh_id = pums_hier_proc_df.loc[i]["HH_ID"]
-                hh_list = pums_hier_org_df.index[
-                    pums_hier_org_df["HH_ID"] == hh_id
-                ].tolist()
-                ind_list += hh_list
-                overall_hh_ind += [hh_counter for x in range(0, len(hh_list))]
-                hh_counter += 1
-            index_dict[g] = ind_list
-            geo_list += [g for x in range(0, len(ind_list))]
-
-        total_list = list(chain(*index_dict.values()))
-        new_df = pums_hier_org_df.loc[total_list]
-        new_df["GEO_CODE"] = geo_list
+        hh_inds, geo_codes = PUMSDataTables._flatten_household_ids(hh_inds_by_geo)
+        sampled_hh_ids = pums_hier_proc_df.loc[hh_inds, "HH_ID"].to_numpy()
+
+        rows, counts = self._gather_household_rows(
+            "raw_data", pums_hier_org_df["HH_ID"], sampled_hh_ids
+        )
+        new_df = pums_hier_org_df.iloc[rows].copy()
+        new_df["GEO_CODE"] = np.repeat(geo_codes, counts)
         new_df["HH_ID_2"] = new_df["HH_ID"]
-        new_df["HH_ID"] = overall_hh_ind
         # renumber the Households
+        new_df["HH_ID"] = np.repeat(np.arange(1, len(sampled_hh_ids) + 1), counts)
         new_df = new_df.reset_index().drop(columns=["index"])
 
         return new_df
 
+    @staticmethod
+    def _flatten_household_ids(hh_inds_by_geo):
+        """
+        _flatten_household_ids
+
+        Arguments:
+            hh_inds_by_geo: a dictionary of household Id by geographic areas
+
+        Returns:
+            tuple of (array of all the household ids, array of the geographic
+            area of each)
+        """
+        if len(hh_inds_by_geo) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=object)
+        geo_list = []
+        ind_list = []
+        for g, hh_inds in hh_inds_by_geo.items():
+            geo_list.append(np.full(len(hh_inds), g, dtype=object))
+            ind_list.append(np.asarray(hh_inds))
+        return np.concatenate(ind_list), np.concatenate(geo_list)
+
+    def _gather_household_rows(self, name, hh_id_column, hh_ids):
+        """
+        _gather_household_rows
+
+        Finds the rows of a table for a list of household ids. The table is
+        sorted by HH_ID once and the start and number of rows of each
+        household are kept, so every later gather is a lookup.
+
+        Arguments:
+            name: the name the row index of the table is kept under
+            hh_id_column: the HH_ID column of the table
+            hh_ids: the household ids to gather, in order, repeats allowed
+
+        Returns:
+            tuple of (the positions of the gathered rows in table order within
+            each household, the number of rows of each household in hh_ids)
+        """
+        if name not in self._household_row_index:
+            hh_id_values = hh_id_column.to_numpy()
+            order = np.argsort(hh_id_values, kind="stable")
+            unique_ids, starts, n_rows = np.unique(
+                hh_id_values[order], return_index=True, return_counts=True
+            )
+            self._household_row_index[name] = (
+                order,
+                pd.Index(unique_ids),
+                starts,
+                n_rows,
+            )
+        order, unique_ids, starts, n_rows = self._household_row_index[name]
+
+        positions = unique_ids.get_indexer(hh_ids)
+        found = positions >= 0
+        counts = np.where(found, n_rows[positions], 0)
+        hh_starts = np.where(found, starts[positions], 0)
+
+        # expand each household into the range of its rows
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.arange(counts.sum()) - offsets + np.repeat(hh_starts, counts)
+        return order[rows], counts
+
     def create_new_pums_table_from_household_ids_with_separate_files(
         self, hh_inds_by_geo
     ):
@@ -181,24 +233,20 @@ class PUMSDataTables:
             pums_people_org_df = self.data["raw_data"]["Person"]
             pums_hier_proc_df = self.data["categorical_table"]
 
-            new_h_df = pd.DataFrame()
-            new_p_df = pd.DataFrame()
-            new_h = []
-            hh_counter = 1
-            for g, hh_inds in hh_inds_by_geo.items():
-                for hh_i in hh_inds:
-                    pums_h = pums_hier_org_df.loc[hh_i].copy()
-                    pums_p = pums_people_org_df[
-                        pums_people_org_df["HH_ID"] == pums_h["HH_ID"]
-                    ].copy()
-                    pums_h["HH_ID"] = hh_counter
-                    pums_h["GEO_CODE"] = g
-                    pums_p["HH_ID"] = hh_counter
-                    pums_p["GEO_CODE"] = g
-                    new_p_df = pd.concat([new_p_df, pums_p])
-                    new_h.append(pums_h)
-                    hh_counter += 1
-            new_h_df = pd.DataFrame(new_h)
+            hh_inds, geo_codes = PUMSDataTables._flatten_household_ids(hh_inds_by_geo)
+
+            new_h_df = pums_hier_org_df.loc[hh_inds].copy()
+            rows, counts = self._gather_household_rows(
+                "Person", pums_people_org_df["HH_ID"], new_h_df["HH_ID"].to_numpy()
+            )
+            new_p_df = pums_people_org_df.iloc[rows].copy()
+
+            # renumber the Households
+            new_hh_ids = np.arange(1, new_h_df.shape[0] + 1)
+            new_h_df["HH_ID"] = new_hh_ids
+            new_h_df["GEO_CODE"] = geo_codes
+            new_p_df["HH_ID"] = np.repeat(new_hh_ids, counts)
+            new_p_df["GEO_CODE"] = np.repeat(geo_codes, counts)
 
             return {"Household": new_h_df, "Person": new_p_df}
         except Exception as e:
@@ -216,11 +264,13 @@ class PUMSDataTables:
         updates the pums_table with the coordnates
 
         Arguments:
-            hh_dict: the result of the sampling should be a dataframe that has households
-                     ids and lat long coordinates
+            fitting_result: the CensusFittingResult with the "Derived PUMS"
+            sample_result: the result of the sampling should be a dataframe that has households
+                           ids and lat long coordinates
 
         Returns:
-            An updated pums table with all of the entries having the appropriate household coordinates
+            An updated pums table with all of the entries having the appropriate household coordinates,
+            a dictionary of the updated tables for separate PUMS files
 
         """
         from census_household_sampling_result import CensusHouseholdSamplingResult
@@ -245,12 +295,38 @@ class PUMSDataTables:
             )
 
         hh_df = sample_result.data["Household Geographic Assignments"]
-        pums_deriv_df = fitting_result.data["Derived PUMS"]
-        pums_deriv_df["latitude"] = pums_deriv_df.apply(
-            lambda x: hh_df[hh_df["HH_ID"] == x["HH_ID"]]["latlon"].values[0][0], axis=1
-        )
-        pums_deriv_df["longitude"] = pums_deriv_df.apply(
-            lambda x: hh_df[hh_df["HH_ID"] == x["HH_ID"]]["latlon"].values[0][1], axis=1
-        )
+        coords_df = hh_df.drop_duplicates("HH_ID").set_index("HH_ID")[
+            ["latitude", "longitude"]
+        ]
 
-        return pums_deriv_df
+        pums_deriv = fitting_result.data["Derived PUMS"]
+        if isinstance(pums_deriv, dict):
+            for pums_deriv_df in pums_deriv.values():
+                PUMSDataTables._join_hh_coordinates(pums_deriv_df, coords_df)
+        else:
+            PUMSDataTables._join_hh_coordinates(pums_deriv, coords_df)
+
+        return pums_deriv
+
+    @staticmethod
+    def _join_hh_coordinates(pums_deriv_df, coords_df):
+        """
+        _join_hh_coordinates
+
+        Adds the latitude and longitude of each row's household in place,
+        looking every HH_ID up once in the coordinates indexed by HH_ID
+
+        Arguments:
+            pums_deriv_df: a derived pums table with a HH_ID column
+            coords_df: latitude and longitude indexed by HH_ID
+        """
+        positions = coords_df.index.get_indexer(pums_deriv_df["HH_ID"])
+        if (positions < 0).any():
+            missing = pums_deriv_df["HH_ID"][positions < 0].unique()
+            raise SynthEcoError(
+                "pums_data_tables: update_pums_table_with_hh_coordinates "
+                + "households {} have no coordinates".format(missing)
+            )
+        coords = coords_df.to_numpy()[positions]
+        pums_deriv_df["latitude"] = coords[:, 0]
+        pums_deriv_df["longitude"] = coords[:, 1]
@@ -0,0 +1,68 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from census_converters import border_reader
+
+
+@pytest.fixture
+def border_file(tmp_path):
+    border_gdf = gpd.GeoDataFrame(
+        {"CTUID": ["5350001.00", "5350002.1", "4620001.00"]},
+        geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1), box(3, 3, 4, 4)],
+        crs="EPSG:3347",
+    )
+    path = tmp_path / "borders.shp"
+    border_gdf.to_file(path)
+    return path
+
+
+class TestReadBorderFile:
+    def test_prefix_filter(self, border_file):
+        border_gdf = border_reader.read_border_file(
+            border_file, "CTUID", prefixes=["535"]
+        )
+        assert list(border_gdf["CTUID"]) == ["5350001.00", "5350002.1"]
+        assert border_gdf.crs.name == "WGS 84"
+
+    def test_geo_ids_filter(self, border_file):
+        border_gdf = border_reader.read_border_file(
+            border_file, "CTUID", prefixes=["535"], geo_ids=["5350002.1"]
+        )
+        assert list(border_gdf["CTUID"]) == ["5350002.1"]
+
+    def test_filter_after_read(self, border_file, monkeypatch):
+        read_file = gpd.read_file
+
+        def read_file_without_where(path, **kwargs):
+            if "where" in kwargs:
+                raise ValueError("no attribute filters")
+            return read_file(path, **kwargs)
+
+        monkeypatch.setattr(border_reader.gpd, "read_file", read_file_without_where)
+        border_gdf = border_reader.read_border_file(
+            border_file, "CTUID", prefixes=["462"]
+        )
+        assert list(border_gdf["CTUID"]) == ["4620001.00"]
+
+    def test_no_filter(self, border_file):
+        border_gdf = border_reader.read_border_file(border_file, "CTUID")
+        assert border_gdf.shape[0] == 3
+
+    def test_cache(self, border_file, tmp_path, monkeypatch):
+        cache_location = tmp_path / "cache"
+        first = border_reader.read_border_file(
+            border_file, "CTUID", prefixes=["535"], cache_location=str(cache_location)
+        )
+        assert len(list(cache_location.glob("borders_*.parquet"))) == 1
+
+        def no_read_file(path, **kwargs):
+            raise AssertionError("border file parsed again")
+
+        monkeypatch.setattr(border_reader.gpd, "read_file", no_read_file)
+        second = border_reader.read_border_file(
+            border_file, "CTUID", prefixes=["535"], cache_location=str(cache_location)
+        )
+        assert list(second["CTUID"]) == list(first["CTUID"])
+        assert second.crs == first.crs
+        assert second.geometry.geom_equals(first.geometry).all()
@@ -0,0 +1,50 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point, box
+
+from border_tables import BorderTables
+from error import SynthEcoError
+
+
+def border_tables():
+    return BorderTables(
+        data_=gpd.GeoDataFrame(
+            {"GEO_UNIT": ["a", "b", "c", "c"]},
+            geometry=[
+                box(0, 0, 1, 1),
+                box(1, 0, 2, 1),
+                box(5, 5, 6, 6),
+                box(6, 5, 7, 6),
+            ],
+        )
+    )
+
+
+class TestBorderTables:
+    def test_geometry_lookup(self):
+        tables = border_tables()
+        assert tables.geometry("a").equals(box(0, 0, 1, 1))
+        assert tables.geometry("c").area == 2.0
+        assert list(tables.geometries(["b", "a"])) == ["b", "a"]
+        assert tables.prepared_geometry("c").contains(Point(6.5, 5.5))
+        assert tables.prepared_geometry("c") is tables.prepared_geometry("c")
+
+    def test_spatial_index(self):
+        tables = border_tables()
+        assert list(tables.geo_units_intersecting(Point(1.5, 0.5))) == ["b"]
+        assert list(tables.geo_units_intersecting(box(0.5, 0, 6.5, 6))) == [
+            "a",
+            "b",
+            "c",
+        ]
+
+    def test_restrict_to(self):
+        tables = border_tables().restrict_to(["c", "a"])
+        assert list(tables.data["GEO_UNIT"]) == ["a", "c", "c"]
+        assert set(tables.geometries()) == {"a", "c"}
+        assert list(tables.geo_units_intersecting(Point(1.5, 0.5))) == []
+
+    def test_missing_geometries(self):
+        tables = border_tables().restrict_to(["a", "d"])
+        with pytest.raises(SynthEcoError, match="geographic areas d, e"):
+            tables.geometries(["a", "d", "e"])
@@ -0,0 +1,75 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from census_converters.census_converter import plugin_map
+from census_converters.plugins.canada_census_converters import (
+    CanadaCensusSummaryPlugin,
+)
+
+
+@pytest.fixture
+def cens_conv_inst():
+    metadata_json = json.load(
+        open(plugin_map["canada"]["metadata_json"], "r"), parse_int=str
+    )
+    geo_codes = ["5350001.00"] * 5 + ["5350002.00"] * 5 + ["5350003.00"] * 5
+    totals = [10, 20, np.nan, 30, 0] + ["0"] * 5 + [np.nan, 40, 50, 60, 70]
+    raw_df = pd.DataFrame(
+        {
+            "GEO_CODE (POR)": geo_codes,
+            "Member ID: Profile of Census Tracts (2247)": [52, 53, 54, 55, 56] * 3,
+            "DATA_QUALITY_FLAG": [0, 0, 0, 0, 9000] + [0] * 10,
+            "Dim: Sex (3): Member ID: [1]: Total - Sex": [
+                str(t) if t == t else ".." for t in totals
+            ],
+        }
+    )
+    population_df = pd.DataFrame(
+        {"total": [100.0, 50.0, 0.0]},
+        index=pd.Index(["5350001.00", "5350002.00", "5350003.00"], name="GEO_CODE"),
+    )
+    return SimpleNamespace(
+        input_params=SimpleNamespace(input_params={"census_fitting_vars": ["HHSIZE"]}),
+        metadata_json=metadata_json,
+        global_tables=SimpleNamespace(data={"total_population_by_geo": population_df}),
+        raw_data_df=raw_df,
+    )
+
+
+class TestCanadaCensusSummaryPlugin:
+    def test_transform(self, cens_conv_inst):
+        sum_df = CanadaCensusSummaryPlugin.transform(cens_conv_inst)["HHSIZE"]
+        totals = sum_df.groupby("GEO_CODE")["total"].apply(list)
+
+        # averages per household size are taken before the fixes, so
+        # size 3 is (0 + 50) / 2 and size 5 is (0 + 0 + 70) / 3
+        assert totals["5350001.00"] == pytest.approx([10, 20, 0.25, 30, 0.7 / 3])
+        # all zero areas are made even
+        assert totals["5350002.00"] == [1.0] * 5
+        # no population in the area
+        assert totals["5350003.00"] == [0.0, 40, 50, 60, 70]
+        assert list(sum_df["HHSIZE"][:5]) == ["1", "2", "3", "4", "5"]
+
+    def test_common_category_alignment(self, cens_conv_inst):
+        cens_conv_inst.input_params.input_params["census_fitting_vars"] = ["AGEGRP"]
+        inds = [1659, 1660, 1661, 1662, 1663, 1664, 1665, 1666]
+        cens_conv_inst.raw_data_df = pd.DataFrame(
+            {
+                "GEO_CODE (POR)": ["5350001.00"] * 8 + ["5350002.00"] * 8,
+                "Member ID: Profile of Census Tracts (2247)": inds * 2,
+                "DATA_QUALITY_FLAG": [0] * 16,
+                "Dim: Sex (3): Member ID: [1]: Total - Sex": [
+                    str(t) for t in range(1, 17)
+                ],
+            }
+        )
+        sum_df = CanadaCensusSummaryPlugin.transform(cens_conv_inst)["AGEGRP"]
+
+        # 75 to 84 and 85 and over make up the common 75 and over category
+        assert list(sum_df["AGEGRP"]) == ["1", "2", "3", "4", "5", "6", "7"] * 2
+        assert list(sum_df.loc["5350001.00", "total"]) == [1, 2, 3, 4, 5, 6, 15]
+        assert list(sum_df.loc["5350002.00", "total"]) == [9, 10, 11, 12, 13, 14, 31]
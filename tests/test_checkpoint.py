@@ -0,0 +1,152 @@
+import os
+import pandas as pd
+import pytest
+
+import checkpoint
+from checkpoint import RunCheckpoints
+
+
+class IP(dict):
+    def has_keyword(self, key):
+        return key in self
+
+
+@pytest.fixture
+def ip(tmp_path):
+    profile_csv = tmp_path / "profile.csv"
+    profile_csv.write_text("a,b\n1,2\n")
+    return IP(
+        census_converter="canada",
+        census_year=2016,
+        census_high_res_geo_unit=2,
+        census_low_res_geo_unit=535,
+        census_fitting_vars=["HHSIZE"],
+        census_fitting_procedure="ipf",
+        census_input_files={"profile_data_csv": str(profile_csv)},
+    )
+
+
+def global_data():
+    pop_df = pd.DataFrame({"total": [1.0, 2.0]}, index=["a", "b"])
+    pop_df.name = "Total Population"
+    return {"total_population_by_geo": pop_df, "geos_of_interest": ["a", "b"]}
+
+
+class TestRunCheckpoints:
+    def test_round_trip(self, ip, tmp_path):
+        run_dir = tmp_path / "run"
+        RunCheckpoints(ip, run_dir_=run_dir).save("global", global_data())
+
+        assert RunCheckpoints(ip, run_dir_=run_dir).load("global") is None
+        data = RunCheckpoints(ip, run_dir_=run_dir, resume_=True).load("global")
+        pd.testing.assert_frame_equal(
+            data["total_population_by_geo"], global_data()["total_population_by_geo"]
+        )
+        assert data["total_population_by_geo"].name == "Total Population"
+        assert data["geos_of_interest"] == ["a", "b"]
+
+    def test_param_change(self, ip, tmp_path):
+        run_dir = tmp_path / "run"
+        checkpoints = RunCheckpoints(ip, run_dir_=run_dir)
+        checkpoints.save("global", global_data())
+        checkpoints.save("fitting", {"Sample Results": {}})
+
+        ip["ipf_alpha"] = 0.5
+        resumed = RunCheckpoints(ip, run_dir_=run_dir, resume_=True)
+        assert resumed.load("global") is not None
+        assert resumed.load("fitting") is None
+
+    def test_source_file_change(self, ip, tmp_path):
+        run_dir = tmp_path / "run"
+        checkpoints = RunCheckpoints(ip, run_dir_=run_dir)
+        checkpoints.save("global", global_data())
+        checkpoints.save("fitting", {"Sample Results": {}})
+
+        with open(ip["census_input_files"]["profile_data_csv"], "a") as f:
+            f.write("3,4\n")
+        resumed = RunCheckpoints(ip, run_dir_=run_dir, resume_=True)
+        assert resumed.load("global") is None
+        # the fitting depends on the global tables
+        assert resumed.load("fitting") is None
+
+    def test_no_run_dir(self, ip):
+        checkpoints = RunCheckpoints(ip, resume_=True)
+        checkpoints.save("global", global_data())
+        assert checkpoints.load("global") is None
+
+    def test_unchanged_files_not_hashed(self, ip, tmp_path, monkeypatch):
+        hashed = []
+        monkeypatch.setattr(
+            checkpoint, "file_hash", lambda name: hashed.append(name) or name
+        )
+        run_dir = tmp_path / "run"
+        RunCheckpoints(ip, run_dir_=run_dir).save("global", global_data())
+        assert len(hashed) == 1
+
+        RunCheckpoints(ip, run_dir_=run_dir).save("global", global_data())
+        assert len(hashed) == 1
+
+        # a new modification time is hashed again even with the same size
+        profile_csv = ip["census_input_files"]["profile_data_csv"]
+        os.utime(profile_csv, ns=(0, os.stat(profile_csv).st_mtime_ns + 10**9))
+        RunCheckpoints(ip, run_dir_=run_dir).save("global", global_data())
+        assert len(hashed) == 2
+
+    def test_us_source_change(self, ip, tmp_path):
+        census_data_dir = tmp_path / "census"
+        pums_dir = census_data_dir / "2019" / "PUMS" / "10"
+        (pums_dir / "h").mkdir(parents=True)
+        (pums_dir / "p").mkdir(parents=True)
+        (pums_dir / "h" / "psam_h10.csv").write_text("SERIALNO\n1\n")
+        (pums_dir / "p" / "psam_p10.csv").write_text("SERIALNO\n1\n")
+        ip.update(
+            census_converter="us",
+            census_year=2019,
+            census_low_res_geo_unit="10",
+            census_data_dir=str(census_data_dir),
+            census_input_files={},
+        )
+        run_dir = tmp_path / "run"
+        checkpoints = RunCheckpoints(ip, run_dir_=run_dir)
+        checkpoints.save("global", global_data())
+        checkpoints.save("pums", {"Household": {}})
+
+        with open(pums_dir / "p" / "psam_p10.csv", "a") as f:
+            f.write("2\n")
+        resumed = RunCheckpoints(ip, run_dir_=run_dir, resume_=True)
+        assert resumed.load("global") is not None
+        assert resumed.load("pums") is None
+
+    def test_store_reingest(self, ip, tmp_path):
+        store = tmp_path / "store"
+        (store / "canada").mkdir(parents=True)
+        (store / "canada" / "part-0.parquet").write_bytes(b"rows")
+        ip["profile_store"] = str(store)
+        run_dir = tmp_path / "run"
+        checkpoints = RunCheckpoints(ip, run_dir_=run_dir)
+        checkpoints.save("global", global_data())
+        checkpoints.save("pums", {"Household": {}})
+
+        (store / "canada" / "part-1.parquet").write_bytes(b"more rows")
+        resumed = RunCheckpoints(ip, run_dir_=run_dir, resume_=True)
+        assert resumed.load("global") is None
+        assert resumed.load("pums") is not None
+
+    def test_census_api(self, ip, tmp_path):
+        ip["use_census_api"] = True
+        run_dir = tmp_path / "run"
+        checkpoints = RunCheckpoints(ip, run_dir_=run_dir)
+        checkpoints.save("global", global_data())
+        checkpoints.save("fitting", {"Sample Results": {}})
+
+        resumed = RunCheckpoints(ip, run_dir_=run_dir, resume_=True)
+        assert resumed.load("global") is None
+        # the fitting is resumed only if the API returned the same data
+        resumed.save("global", global_data())
+        assert resumed.load("fitting") is not None
+
+        resumed = RunCheckpoints(ip, run_dir_=run_dir, resume_=True)
+        changed = global_data()
+        changed["geos_of_interest"] = ["a"]
+        resumed.save("global", changed)
+        assert resumed.load("fitting") is None
@@ -0,0 +1,167 @@
+import pickle
+import numpy as np
+import geopandas as gpd
+import pytest
+import shapely
+from shapely.geometry import Point, Polygon, box
+
+from census_household_sampling.plugins.uniform_household_sampling import (
+    UniformHouseholdSampling,
+)
+from census_household_sampling.plugins.density_weighted_household_sampling import (
+    WeightedPointSampler,
+)
+from census_household_sampling.plugins.triangulation_household_sampling import (
+    TriangulatedPolygon,
+    TriangulationCache,
+)
+from error import SynthEcoError
+
+
+class TestUniformHouseholdSampling:
+    def test_points_in_thin_ring(self):
+        ring = Point(0, 0).buffer(1).difference(Point(0, 0).buffer(0.95))
+        x, y = UniformHouseholdSampling._sample_points_in_polygon(
+            ring, 5000, np.random.default_rng(0)
+        )
+        assert len(x) == len(y) == 5000
+        assert gpd.points_from_xy(x, y).within(ring).all()
+        # uniform over the ring so the halves get about the same number
+        assert abs((x < 0).mean() - 0.5) < 0.03
+
+    def test_small_batches(self):
+        square = box(0, 0, 2, 2).difference(box(0, 0, 1, 2))
+        x, y = UniformHouseholdSampling._sample_points_in_polygon(
+            square, 100, np.random.default_rng(1), max_batch_size=7
+        )
+        assert len(x) == 100
+        assert (x >= 1).all()
+
+    def test_select_house_coordinates(self):
+        geo_code, x, y = UniformHouseholdSampling._select_house_coordinates(
+            "b", box(5, 5, 6, 6), 10, rng=np.random.default_rng(2)
+        )
+        assert geo_code == "b"
+        assert len(x) == len(y) == 10
+        assert ((x >= 5) & (x <= 6) & (y >= 5) & (y <= 6)).all()
+
+
+class TestTriangulationHouseholdSampling:
+    def test_triangles_cover_polygon(self):
+        shapes = [
+            box(0, 0, 2, 2).difference(box(1, 1, 2, 2)),
+            box(0, 0, 3, 3).difference(box(1, 1, 2, 2)).union(box(5, 5, 6, 6)),
+            Point(0, 0).buffer(1).difference(Point(0, 0).buffer(0.9)),
+        ]
+        for shape in shapes:
+            triangulation = TriangulatedPolygon(shape)
+            triangles = shapely.polygons(triangulation.triangles)
+            inside = shapely.union_all(triangles[~triangulation.crossing])
+            assert np.isclose(
+                shapely.union_all(triangles).intersection(shape).area, shape.area
+            )
+            assert np.isclose(inside.difference(shape).area, 0.0)
+
+    def test_points_in_polygon(self):
+        ring = Point(0, 0).buffer(1).difference(Point(0, 0).buffer(0.95))
+        x, y = TriangulatedPolygon(ring).sample(5000, np.random.default_rng(0))
+        assert len(x) == 5000
+        assert gpd.points_from_xy(x, y).within(ring.buffer(1.0e-9)).all()
+        assert abs((x < 0).mean() - 0.5) < 0.03
+
+        # the border crosses triangles of the notched square
+        notched = box(0, 0, 3, 3).difference(
+            Polygon([(1, 1), (3, 1.5), (1, 2), (2.5, 1.5)])
+        )
+        triangulation = TriangulatedPolygon(notched)
+        assert triangulation.crossing.any()
+        x, y = triangulation.sample(40000, np.random.default_rng(2))
+        assert gpd.points_from_xy(x, y).within(notched.buffer(1.0e-9)).all()
+        assert abs((x < 1).mean() - 3.0 / notched.area) < 0.01
+
+    def test_area_weighted(self):
+        shape = box(0, 0, 1, 1).union(box(2, 0, 5, 1))
+        x, y = TriangulatedPolygon(shape).sample(20000, np.random.default_rng(1))
+        assert abs((x > 2).mean() - 0.75) < 0.02
+
+    def test_triangulation_cache(self, tmp_path):
+        geometries = {"a": box(0, 0, 1, 1), "b": box(0, 0, 2, 1)}
+        triangulations = TriangulationCache(tmp_path).get(geometries)
+        assert set(triangulations) == {"a", "b"}
+        assert (tmp_path / "triangulations.pkl").exists()
+
+        # a later run reads the cached ones and triangulates a changed border
+        cache = TriangulationCache(tmp_path)
+        digest_a = cache.triangulations["a"][0]
+        triangulations = cache.get({"a": box(0, 0, 1, 1), "b": box(0, 0, 3, 1)})
+        assert cache.triangulations["a"][0] == digest_a
+        assert np.isclose(triangulations["b"].areas.sum(), 3.0)
+        assert np.isclose(
+            TriangulationCache(tmp_path).triangulations["b"][1].areas.sum(), 3.0
+        )
+
+
+class TestDensityWeightedHouseholdSampling:
+    def weight_layer(self):
+        return gpd.GeoDataFrame(
+            {"POP": [30.0, 0.0, 10.0]},
+            geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1), box(2, 0, 4, 1)],
+        )
+
+    def test_count_weighted(self):
+        sampler = WeightedPointSampler(self.weight_layer(), "POP")
+        # the tract only covers half of the last block
+        x, y = sampler(box(0, 0, 3, 1), 20000, np.random.default_rng(0))
+        assert len(x) == 20000
+        assert not ((x > 1) & (x < 2)).any()
+        assert abs((x < 1).mean() - 30.0 / 35.0) < 0.02
+        assert (x <= 3).all()
+
+    def test_area_weighted(self):
+        sampler = WeightedPointSampler(self.weight_layer())
+        x, y = sampler(box(0, 0, 4, 1), 20000, np.random.default_rng(1))
+        assert abs((x > 2).mean() - 0.5) < 0.02
+
+    def test_no_weights_is_uniform(self):
+        sampler = WeightedPointSampler(self.weight_layer(), "POP")
+        x, y = sampler(box(10, 10, 11, 12), 100, np.random.default_rng(2))
+        assert ((x >= 10) & (x <= 11) & (y >= 10) & (y <= 12)).all()
+
+    def test_pieces_sampled_at_once(self):
+        notched = box(0, 0, 4, 4).difference(box(1, 1, 4, 4))
+        x, y = WeightedPointSampler._sample_points_in_pieces(
+            [box(5, 0, 6, 1), notched], np.array([100, 7000]), np.random.default_rng(5)
+        )
+        assert ((x[:100] >= 5) & (y[:100] <= 1)).all()
+        assert gpd.points_from_xy(x[100:], y[100:]).within(notched).all()
+        assert abs((y[100:] > 1).mean() - 3.0 / 7.0) < 0.02
+
+    def test_pickled_sampler(self):
+        # the sampler and its spatial index reach the workers pickled
+        sampler = pickle.loads(
+            pickle.dumps(WeightedPointSampler(self.weight_layer(), "POP"))
+        )
+        x, y = sampler(box(0, 0, 3, 1), 1000, np.random.default_rng(6))
+        assert not ((x > 1) & (x < 2)).any()
+
+    def test_zero_weights(self):
+        sampler = WeightedPointSampler(self.weight_layer(), "POP")
+        # only the block with no population is inside, the others touch it
+        with pytest.raises(SynthEcoError, match="POP weights"):
+            sampler(box(1, 0, 2, 1), 10, np.random.default_rng(3))
+
+    def test_missing_counts(self):
+        weight_gdf = self.weight_layer()
+        weight_gdf.loc[0, "POP"] = np.nan
+        sampler = WeightedPointSampler(weight_gdf, "POP")
+        assert list(sampler.weights) == [0.0, 0.0, 10.0]
+        x, y = sampler(box(0, 0, 4, 1), 100, np.random.default_rng(4))
+        assert (x >= 2).all()
+
+    def test_invalid_counts(self):
+        weight_gdf = self.weight_layer()
+        weight_gdf.loc[2, "POP"] = -1.0
+        with pytest.raises(SynthEcoError, match="POP of the weight layer has negative"):
+            WeightedPointSampler(weight_gdf, "POP")
+        with pytest.raises(SynthEcoError, match="no count column HOUSEHOLDS"):
+            WeightedPointSampler(weight_gdf, "HOUSEHOLDS")
@@ -0,0 +1,230 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from error import SynthEcoError
+from census_fitting_procedures.plugins.ipf_census_fitting import (
+    HouseholdKernelCache,
+    IPFCensusHouseholdFittingProcedure,
+    ipfn_fit,
+)
+from census_fitting_procedures.plugins.numpy_ipf_census_fitting import (
+    ipf_numpy,
+    ipf_numpy_batched,
+    numpy_ipf_fit,
+    stack_geo_marginals,
+)
+
+
+@pytest.fixture
+def pums_freq():
+    return pd.DataFrame(
+        {
+            "AGEGRP": ["1", "1", "1", "2", "2", "3", "3", "3"],
+            "HHSIZE": [1, 2, 3, 1, 3, 1, 2, 3],
+            "total": [8.0, 4.0, 6.0, 7.0, 3.0, 6.0, 5.0, 2.0],
+        }
+    )
+
+
+@pytest.fixture
+def marginals():
+    agegrp = pd.Series([20.0, 18.0, 22.0], index=pd.Index(["1", "2", "3"]))
+    agegrp.index.name = "AGEGRP"
+    hhsize = pd.Series([25.0, 15.0, 20.0], index=pd.Index([1, 2, 3]))
+    hhsize.index.name = "HHSIZE"
+    return [agegrp, hhsize]
+
+
+class TestNumpyIPF:
+    def test_matches_ipfn(self, pums_freq, marginals):
+        fitting_vars = ["AGEGRP", "HHSIZE"]
+        expected = ipfn_fit(
+            pums_freq.copy(), marginals, fitting_vars, 1000, 1.0e-8, 1.0e-12
+        )
+        result = numpy_ipf_fit(
+            pums_freq.copy(), marginals, fitting_vars, 1000, 1.0e-8, 1.0e-12
+        )
+
+        expected_df = expected[0].set_index(fitting_vars)["total"]
+        result_df = result[0].set_index(fitting_vars)["total"]
+        assert np.allclose(
+            result_df.loc[expected_df.index].values, expected_df.values, rtol=1e-6
+        )
+        assert result[1] == expected[1] == 1
+        assert len(result[2]) == len(expected[2])
+
+    def test_marginals_are_fitted(self, pums_freq, marginals):
+        result, converged, conv_df = numpy_ipf_fit(
+            pums_freq, marginals, ["AGEGRP", "HHSIZE"], 1000, 1.0e-8, 1.0e-12
+        )
+        assert converged == 1
+        assert conv_df["conv"].iloc[-1] < 1.0e-8
+        for var, marginal in zip(["AGEGRP", "HHSIZE"], marginals):
+            sums = result.groupby(var)["total"].sum()
+            assert np.allclose(sums.loc[marginal.index], marginal)
+
+    def test_nonconvergence(self):
+        # the two marginals disagree on the total so IPF can not converge
+        weights, converged, history = ipf_numpy(
+            [1.0, 1.0, 1.0, 1.0],
+            [[0, 0, 1, 1], [0, 1, 0, 1]],
+            [[5.0, 5.0], [2.0, 2.0]],
+            max_iterations=0,
+        )
+        assert converged == 0
+        assert len(history) == 1
+        assert history[0] > 0.5
+
+    def test_missing_category(self, pums_freq, marginals):
+        marginals[0] = marginals[0].drop("3")
+        with pytest.raises(SynthEcoError):
+            numpy_ipf_fit(pums_freq, marginals, ["AGEGRP", "HHSIZE"], 10, 1e-5, 1e-8)
+
+
+class TestBatchedIPF:
+    def test_matches_single_geo(self):
+        seed = [8.0, 4.0, 6.0, 7.0, 3.0, 6.0, 5.0, 2.0]
+        codes = [[0, 0, 0, 1, 1, 2, 2, 2], [0, 1, 2, 0, 2, 0, 1, 2]]
+        marginals = [
+            np.array([[20.0, 18.0, 22.0], [5.0, 5.0, 10.0], [0.0, 3.0, 1.0]]),
+            np.array([[25.0, 15.0, 20.0], [10.0, 4.0, 6.0], [2.0, 1.0, 1.0]]),
+        ]
+        weights, converged, iterations = ipf_numpy_batched(
+            seed, codes, marginals, max_iterations=1000
+        )
+        assert weights.shape == (3, 8)
+        for g in range(3):
+            expected, expected_converged, history = ipf_numpy(
+                seed, codes, [m[g] for m in marginals], max_iterations=1000
+            )
+            assert np.allclose(weights[g], expected)
+            assert converged[g] == expected_converged
+            assert iterations[g] == len(history)
+
+    def test_stack_geo_marginals(self):
+        summary_tables = {
+            "HHSIZE": pd.DataFrame(
+                {
+                    "GEO_CODE": ["a", "a", "b", "b", "c", "c"],
+                    "HHSIZE": [1, 2, 1, 2, 1, 2],
+                    "total": [30.0, 10.0, 0.0, 0.0, 1.0, 3.0],
+                }
+            ).set_index("GEO_CODE")
+        }
+        categories, marginals = stack_geo_marginals(
+            summary_tables, ["HHSIZE"], ["c", "b", "a"], [8.0, 5.0, 4.0]
+        )
+        assert list(categories[0]) == [1, 2]
+        assert np.array_equal(marginals[0], [[2.0, 6.0], [0.0, 0.0], [3.0, 1.0]])
+
+
+class TestDistanceKernels:
+    def test_ordinal_distance_broadcasts(self):
+        c_o_d = IPFCensusHouseholdFittingProcedure.calculate_ordinal_distance
+        pums_values = np.array([1.0, 2.0, 3.0, 5.0])
+        table_values = np.array([1.0, 4.0])
+        expected = np.array(
+            [[c_o_d(p, t, 4, 0.5) for p in pums_values] for t in table_values]
+        )
+        result = c_o_d(pums_values[np.newaxis, :], table_values[:, np.newaxis], 4, 0.5)
+        assert np.allclose(result, expected)
+        assert result[0, 0] == 1.0
+
+    def test_categorical_distance_broadcasts(self):
+        c_c_d = IPFCensusHouseholdFittingProcedure.calculate_categorical_distance
+        pums_values = np.array([1.0, 2.0, 3.0, 2.0])
+        table_values = np.array([2.0, 3.0])
+        result = c_c_d(pums_values[np.newaxis, :], table_values[:, np.newaxis], 0.2)
+        assert np.array_equal(result, [[0.8, 0.2, 0.8, 0.2], [0.8, 0.8, 0.2, 0.8]])
+        assert c_c_d(1.0, 1.0, 0.2) == 0.2
+
+
+@pytest.fixture
+def kernel_inputs():
+    pums = pd.DataFrame(
+        {
+            "AGEGRP": ["1", "2", "3", "1", "2", "1", "3"],
+            "HHSIZE": ["1", "2", "1", "1", "3", "2", "1"],
+        },
+        index=[10, 11, 12, 13, 14, 15, 16],
+    )
+    frequency_table = pd.DataFrame(
+        {
+            "AGEGRP": ["1", "1", "2", "2", "3"],
+            "HHSIZE": ["1", "2", "2", "3", "1"],
+            "total": [2.0, 1.0, 1.0, 1.0, 2.0],
+        }
+    )
+    metadata_json = {
+        "AGEGRP": {"sample_type": "ordinal"},
+        "HHSIZE": {"sample_type": "categorical"},
+    }
+    return pums, frequency_table, ["AGEGRP", "HHSIZE"], metadata_json
+
+
+class TestHouseholdKernelCache:
+    def test_matches_per_row_distances(self, kernel_inputs):
+        pums, frequency_table, fitting_vars, metadata_json = kernel_inputs
+        cache = HouseholdKernelCache(
+            pums, frequency_table, fitting_vars, metadata_json, k=0.5
+        )
+        c_o_d = IPFCensusHouseholdFittingProcedure.calculate_ordinal_distance
+        c_c_d = IPFCensusHouseholdFittingProcedure.calculate_categorical_distance
+        ages = pums["AGEGRP"].astype(float).values
+        sizes = pums["HHSIZE"].astype(float).values
+        for age, size in frequency_table[fitting_vars].astype(float).values:
+            distances = c_o_d(ages, age, 2, 0.5) * c_c_d(sizes, size, 0.0)
+            result = cache.probabilities((str(int(age)), str(int(size))))
+            assert np.allclose(result, distances / distances.sum())
+        assert list(cache.pums_index) == list(pums.index)
+
+    def test_persisted_cache_is_reused(self, kernel_inputs, tmp_path):
+        pums, frequency_table, fitting_vars, metadata_json = kernel_inputs
+        cache = HouseholdKernelCache(
+            pums, frequency_table, fitting_vars, metadata_json, location_=tmp_path
+        )
+        files = list(tmp_path.iterdir())
+        assert len(files) == 1
+
+        reloaded = HouseholdKernelCache(
+            pums, frequency_table, fitting_vars, metadata_json, location_=tmp_path
+        )
+        assert np.array_equal(reloaded.prob_matrix, cache.prob_matrix)
+        assert reloaded.combo_rows == cache.combo_rows
+
+        HouseholdKernelCache(
+            pums,
+            frequency_table,
+            fitting_vars,
+            metadata_json,
+            k=0.1,
+            location_=tmp_path,
+        )
+        assert len(list(tmp_path.iterdir())) == 2
+
+    def test_sample_matches_probabilities(self, kernel_inputs):
+        pums, frequency_table, fitting_vars, metadata_json = kernel_inputs
+        cache = HouseholdKernelCache(
+            pums, frequency_table, fitting_vars, metadata_json, k=0.5
+        )
+        fit_table = pd.DataFrame(
+            {"AGEGRP": ["1", "3"], "HHSIZE": ["2", "1"], "total": [60000, 0]}
+        )
+        draws = cache.sample(fit_table, np.random.default_rng(3))
+        assert draws.shape == (60000,)
+        frequencies = pd.Series(draws).value_counts(normalize=True)
+        expected = pd.Series(cache.probabilities(("1", "2")), index=pums.index)
+        assert np.allclose(
+            frequencies.reindex(pums.index, fill_value=0.0), expected, atol=0.01
+        )
+
+    def test_sample_is_reproducible(self, kernel_inputs):
+        pums, frequency_table, fitting_vars, metadata_json = kernel_inputs
+        cache = HouseholdKernelCache(pums, frequency_table, fitting_vars, metadata_json)
+        fit_table = frequency_table.copy()
+        first = cache.sample(fit_table, np.random.default_rng(7))
+        second = cache.sample(fit_table, np.random.default_rng(7))
+        assert np.array_equal(first, second)
+        assert len(first) == frequency_table["total"].sum()
+        assert set(first) <= set(pums.index)
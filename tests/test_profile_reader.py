@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from census_converters import profile_reader
+
+
+@pytest.fixture
+def profile_csv(tmp_path):
+    path = tmp_path / "profile.csv"
+    pd.DataFrame(
+        {
+            "CENSUS_YEAR": [2016, 2016, 2016, 2011],
+            "GEO_CODE (POR)": ["5350001.00", "4620001.00", "5350002.00", "5350001.00"],
+            "GEO_LEVEL": [2, 2, 2, 2],
+            "DIM: Profile of Census Tracts (2247)": ["a", "b", "c", "d"],
+        }
+    ).to_csv(path, index=False)
+    return path
+
+
+class TestReadProfileData:
+    def test_filter(self, profile_csv):
+        raw_df = profile_reader.read_profile_data(profile_csv, 535, 2, 2016)
+        assert list(raw_df["GEO_CODE (POR)"]) == ["5350001.00", "5350002.00"]
+        assert list(raw_df["DIM: Profile of Census Tracts (2247)"]) == ["a", "c"]
+
+    def test_read_once(self, profile_csv, monkeypatch):
+        first = profile_reader.read_profile_data(profile_csv, 462, 2, 2016)
+        monkeypatch.setattr(
+            profile_reader.pd,
+            "read_csv",
+            lambda *args, **kwargs: pytest.fail("profile file read again"),
+        )
+        second = profile_reader.read_profile_data(profile_csv, 462, 2, 2016)
+        pd.testing.assert_frame_equal(first, second)
+        # callers get their own copy
+        second["GEO_LEVEL"] = 0
+        third = profile_reader.read_profile_data(profile_csv, 462, 2, 2016)
+        assert (third["GEO_LEVEL"] == 2).all()
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from census_converters import profile_reader, profile_store
+
+
+@pytest.fixture
+def canada_csv(tmp_path):
+    path = tmp_path / "profile.csv"
+    pd.DataFrame(
+        {
+            "CENSUS_YEAR": [2016] * 6,
+            "GEO_CODE (POR)": ["535", "5350001.00", "5350001.00", "5350002.00"]
+            + ["4620001.00", "4620002.00"],
+            "GEO_LEVEL": [1, 2, 2, 2, 2, 2],
+            "GEO_NAME": ["Toronto", "1", "1", "2", "1", "2"],
+            "GNR": [1.0] * 6,
+            "DATA_QUALITY_FLAG": [0, 0, 0, 9000, 0, 0],
+            "DIM: Profile of Census Tracts (2247)": ["a", "a", "b", "a", "a", "b"],
+            "Member ID: Profile of Census Tracts (2247)": [1, 1, 2, 1, 1, 2],
+            "Dim: Sex (3): Member ID: [1]: Total - Sex": [
+                "9",
+                "4",
+                "..",
+                "5",
+                "1",
+                "2",
+            ],
+            "Dim: Sex (3): Member ID: [2]: Male": [5, 2, 0, 3, 1, 1],
+        }
+    ).to_csv(path, index=False)
+    return path
+
+
+class TestCanadaProfileStore:
+    def test_same_rows_as_csv(self, canada_csv, tmp_path):
+        store = tmp_path / "store"
+        assert profile_store.ingest_canada_profile(canada_csv, store, chunksize=2) == 6
+
+        stored = profile_store.read_canada_profile(store, 535, 2, 2016)
+        read = profile_reader.read_profile_data(canada_csv, 535, 2, 2016)
+        read = read[stored.columns].reset_index(drop=True)
+        read["Dim: Sex (3): Member ID: [1]: Total - Sex"] = read[
+            "Dim: Sex (3): Member ID: [1]: Total - Sex"
+        ].astype(str)
+        assert list(stored.columns) == list(profile_store.CANADA_PROFILE_COLUMNS.keys())
+        pd.testing.assert_frame_equal(stored.reset_index(drop=True), read)
+
+    def test_reingest_replaces(self, canada_csv, tmp_path):
+        store = tmp_path / "store"
+        profile_store.ingest_canada_profile(canada_csv, store)
+        profile_store.ingest_canada_profile(canada_csv, store)
+        stored = profile_store.read_canada_profile(store, 462, 2, 2016)
+        assert list(stored["GEO_CODE (POR)"]) == ["4620001.00", "4620002.00"]
+
+
+class TestUSProfileStore:
+    def test_round_trip(self, tmp_path):
+        profile_csv = tmp_path / "prof_10.csv"
+        pd.DataFrame(
+            {
+                "state": [10, 10],
+                "county": [1, 3],
+                "tract": [100, 200],
+                "DP05_0001E": [500, 600],
+                "DP04_0001E": [200, 250],
+                "DP05_0005E": [10, 20],
+                "DP99_0001E": [1, 1],
+            }
+        ).to_csv(profile_csv, index=False)
+        metadata_json = {"AGEP": {"profile_vars": ["DP05_0005E"]}, "other": "x"}
+        store = tmp_path / "store"
+        profile_store.ingest_us_profile(profile_csv, store, 2020, "10", metadata_json)
+
+        prof_df = profile_store.read_us_profile(store, 2020, "10", ["DP05_0005E"])
+        assert list(prof_df.columns) == ["state", "county", "tract", "DP05_0005E"]
+        assert list(prof_df["DP05_0005E"]) == [10, 20]
+        assert profile_store.read_us_profile(store, 2019, "10", []).shape[0] == 0
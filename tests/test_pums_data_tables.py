@@ -0,0 +1,156 @@
+import time
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from error import SynthEcoError
+from census_fitting_result import CensusFittingResult
+from census_household_sampling_result import CensusHouseholdSamplingResult
+from pums_data_tables import PUMSDataTables
+
+
+def hier_pums_tables():
+    raw = pd.DataFrame(
+        {
+            "HH_ID": [7, 3, 7, 5, 3, 7],
+            "AGEGRP": ["1", "2", "3", "1", "2", "2"],
+        },
+        index=[10, 11, 12, 13, 14, 15],
+    )
+    categorical = pd.DataFrame({"HH_ID": [3, 5, 7], "HHSIZE": ["2", "1", "3"]})
+    return PUMSDataTables(
+        data_={"raw_data": raw, "categorical_table": categorical, "separate": False}
+    )
+
+
+def separate_pums_tables():
+    household = pd.DataFrame(
+        {"HH_ID": [7, 3, 5], "TENURE": ["1", "2", "1"]}, index=[0, 1, 2]
+    )
+    person = pd.DataFrame(
+        {"HH_ID": [3, 7, 5, 7, 3], "AGE": [30, 41, 25, 39, 2]},
+        index=[20, 21, 22, 23, 24],
+    )
+    return PUMSDataTables(
+        data_={
+            "raw_data": {"Household": household, "Person": person},
+            "categorical_table": household,
+            "separate": True,
+        }
+    )
+
+
+class TestPUMSGather:
+    def test_hier_gather(self):
+        pums_tables = hier_pums_tables()
+        new_df = pums_tables.create_new_pums_table_from_household_ids(
+            {"a": [2, 0], "b": [], "c": [2, 1]}
+        )
+
+        assert list(new_df.columns) == ["HH_ID", "AGEGRP", "GEO_CODE", "HH_ID_2"]
+        assert list(new_df.index) == list(range(9))
+        assert list(new_df["HH_ID_2"]) == [7, 7, 7, 3, 3, 7, 7, 7, 5]
+        assert list(new_df["HH_ID"]) == [1, 1, 1, 2, 2, 3, 3, 3, 4]
+        assert list(new_df["GEO_CODE"]) == ["a"] * 5 + ["c"] * 4
+        # rows of a household keep their order in the raw data
+        assert list(new_df["AGEGRP"][:5]) == ["1", "3", "2", "2", "2"]
+
+    def test_hier_gather_reuses_index(self):
+        pums_tables = hier_pums_tables()
+        first = pums_tables.create_new_pums_table_from_household_ids({"a": [1]})
+        second = pums_tables.create_new_pums_table_from_household_ids({"a": [1]})
+        assert list(pums_tables._household_row_index) == ["raw_data"]
+        assert first.equals(second)
+
+    def test_separate_gather(self):
+        pums_tables = separate_pums_tables()
+        new_tables = pums_tables.create_new_pums_table_from_household_ids(
+            {"a": [1, 0], "b": [1]}
+        )
+        household = new_tables["Household"]
+        person = new_tables["Person"]
+
+        assert list(household.index) == [1, 0, 1]
+        assert list(household["HH_ID"]) == [1, 2, 3]
+        assert list(household["TENURE"]) == ["2", "1", "2"]
+        assert list(household["GEO_CODE"]) == ["a", "a", "b"]
+
+        assert list(person.index) == [20, 24, 21, 23, 20, 24]
+        assert list(person["HH_ID"]) == [1, 1, 2, 2, 3, 3]
+        assert list(person["AGE"]) == [30, 2, 41, 39, 30, 2]
+        assert list(person["GEO_CODE"]) == ["a", "a", "a", "a", "b", "b"]
+
+
+def coordinate_results(derived_pums, hh_df):
+    fitting_result = MagicMock(spec=CensusFittingResult)
+    fitting_result.data = {"Derived PUMS": derived_pums}
+    sample_result = MagicMock(spec=CensusHouseholdSamplingResult)
+    sample_result.data = {"Household Geographic Assignments": hh_df}
+    return fitting_result, sample_result
+
+
+class TestHouseholdCoordinates:
+    def test_coordinates_joined_on_hh_id(self):
+        derived = pd.DataFrame({"HH_ID": [2, 1, 2, 3], "AGE": [4, 5, 6, 7]})
+        hh_df = pd.DataFrame(
+            {
+                "HH_ID": [1, 2, 3],
+                "GEO_CODE": ["a", "a", "b"],
+                "longitude": [-70.0, -71.0, -72.0],
+                "latitude": [40.0, 41.0, 42.0],
+            }
+        )
+        result = hier_pums_tables().update_pums_table_with_hh_coordinates(
+            *coordinate_results(derived, hh_df)
+        )
+        assert list(result["latitude"]) == [41.0, 40.0, 41.0, 42.0]
+        assert list(result["longitude"]) == [-71.0, -70.0, -71.0, -72.0]
+
+    def test_coordinates_separate_tables(self):
+        derived = {
+            "Household": pd.DataFrame({"HH_ID": [1, 2]}),
+            "Person": pd.DataFrame({"HH_ID": [1, 1, 2]}),
+        }
+        hh_df = pd.DataFrame(
+            {"HH_ID": [2, 1], "longitude": [-71.0, -70.0], "latitude": [41.0, 40.0]}
+        )
+        result = separate_pums_tables().update_pums_table_with_hh_coordinates(
+            *coordinate_results(derived, hh_df)
+        )
+        assert list(result["Household"]["latitude"]) == [40.0, 41.0]
+        assert list(result["Person"]["longitude"]) == [-70.0, -70.0, -71.0]
+
+    def test_missing_household(self):
+        derived = pd.DataFrame({"HH_ID": [1, 4]})
+        hh_df = pd.DataFrame({"HH_ID": [1], "longitude": [-70.0], "latitude": [40.0]})
+        with pytest.raises(SynthEcoError):
+            hier_pums_tables().update_pums_table_with_hh_coordinates(
+                *coordinate_results(derived, hh_df)
+            )
+
+    @pytest.mark.benchmark
+    def test_coordinates_one_million_people(self):
+        rng = np.random.default_rng(0)
+        n_households = 400000
+        hh_df = pd.DataFrame(
+            {
+                "HH_ID": rng.permutation(n_households) + 1,
+                "longitude": rng.uniform(-80.0, -70.0, n_households),
+                "latitude": rng.uniform(40.0, 50.0, n_households),
+            }
+        )
+        derived = pd.DataFrame({"HH_ID": rng.integers(1, n_households + 1, 1000000)})
+
+        expected = derived.merge(hh_df, on="HH_ID", how="left")
+
+        t1 = time.time()
+        result = hier_pums_tables().update_pums_table_with_hh_coordinates(
+            *coordinate_results(derived, hh_df)
+        )
+        elapsed = time.time() - t1
+
+        assert np.array_equal(result["latitude"], expected["latitude"])
+        assert np.array_equal(result["longitude"], expected["longitude"])
+        assert elapsed < 10.0
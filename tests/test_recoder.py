@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from census_converters.recoder import CommonVarRecoder
+
+
+class TestCommonVarRecoder:
+    def test_ranges_and_indices(self):
+        common_var_map = {
+            "1": {"pums_inds": ["0", "17"]},
+            "2": {"pums_inds": ["18", "64"]},
+            "3": {"pums_inds": ["65", "99"]},
+            "4": {"pums_inds": ["-999999"]},
+        }
+        values = pd.Series([0, 17, 18, 40, 64, 65, 99, 100, -999999, -5])
+        recoded = CommonVarRecoder(common_var_map)(values)
+        expected = [1, 1, 2, 2, 2, 3, 3, np.nan, 4, np.nan]
+        np.testing.assert_array_equal(recoded.to_numpy(), expected)
+
+    def test_later_categories_win(self):
+        common_var_map = {
+            "1": {"pums_inds": ["0", "10"]},
+            "2": {"pums_inds": ["5"]},
+            "3": {"pums_inds": ["8.5", "20"]},
+        }
+        values = pd.Series([4.9, 5, 5.1, 8.4, 8.5, 10, 20, 20.1])
+        recoded = CommonVarRecoder(common_var_map)(values)
+        expected = [1, 2, 1, 1, 3, 3, 3, np.nan]
+        np.testing.assert_array_equal(recoded.to_numpy(), expected)
+
+    def test_categorical(self):
+        common_var_map = {
+            "1": {"pums_inds": ["1", "2"]},
+            "2": {"pums_inds": ["3"]},
+        }
+        values = pd.Series(["2", "3", "1", "9"])
+        recoded = CommonVarRecoder(common_var_map, categorical=True)(values)
+        assert list(recoded[:3]) == ["1", "2", "1"]
+        assert pd.isnull(recoded[3])
@@ -104,6 +104,50 @@ class TestFormatDF:
 FunctionCallMetadata = namedtuple("FunctionCallMetadata", ["params", "return_value"])
 
 
+class TestProfileFileRead:
+    class IP(dict):
+        @property
+        def input_params(self):
+            return self
+
+        def has_keyword(self, key):
+            return key in self
+
+    @pytest.fixture
+    def ip(self, tmp_path):
+        state_dir = tmp_path / "2020" / "Profile" / "10"
+        state_dir.mkdir(parents=True)
+        pd.DataFrame(
+            {
+                "state": [10, 10],
+                "county": [1, 3],
+                "tract": [40100, 950000],
+                "DP05_0001E": [500, 600],
+                "DP04_0001E": [200, 250],
+                "DP05_0005E": [10, 20],
+            }
+        ).to_csv(state_dir / "prof_10.csv", index=False)
+        return self.IP(
+            census_data_dir=str(tmp_path),
+            census_year=2020,
+            census_low_res_geo_unit="10",
+            census_fitting_vars=["AGEP"],
+        )
+
+    def test_global_read(self, ip):
+        raw_df = us.USCensusGlobalPlugin._read_raw_data_into_pandas_from_file(ip)
+        assert list(raw_df.index) == ["10001040100", "10003950000"]
+        assert list(raw_df["DP05_0001E"]) == [500, 600]
+
+    def test_summary_read(self, ip):
+        metadata_json = {"AGEP": {"profile_vars": ["DP05_0005E"]}}
+        raw_df = us.USCensusSummaryPlugin._read_raw_data_into_pandas_from_file(
+            ip, metadata_json
+        )
+        assert list(raw_df.index) == ["10001040100", "10003950000"]
+        assert list(raw_df.columns) == ["state", "county", "tract", "DP05_0005E"]
+
+
 class TestUSCensusPlugins:
     @pytest.fixture
     def ip(self):
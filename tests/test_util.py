@@ -1,7 +1,7 @@
 import pytest
-import random as rn
 import os
 import csv
+import numpy as np
 import pandas as pd
 import shutil
 
@@ -11,23 +11,103 @@ import util
 
 class TestRandomRoundToInteger:
     def test_round_float_up(self):
-        float_value = 1.2
+        float_value = 1.6
         seed = 1
 
-        rn.seed(1)
-        assert rn.random() == 0.13436424411240122
+        assert np.random.default_rng(1).random() == 0.5118216247002567
 
         assert util.random_round_to_integer(float_value, seed) == 2
 
     def test_round_float_down(self):
-        float_value = 1.1
+        float_value = 1.5
         seed = 1
 
-        rn.seed(1)
-        assert rn.random() == 0.13436424411240122
+        assert np.random.default_rng(1).random() == 0.5118216247002567
 
         assert util.random_round_to_integer(float_value, seed) == 1
 
+    def test_round_array(self):
+        values = np.array([1.6, 1.5, 3.0, 0.0])
+        rng = np.random.default_rng(1)
+        draws = np.random.default_rng(1).random(4)
+
+        result = util.random_round_array(values, rng)
+        assert result.dtype == np.int64
+        assert list(result) == list(np.floor(values) + (draws < values % 1))
+
+        means = util.random_round_array(np.full(20000, 2.25), rng).mean()
+        assert abs(means - 2.25) < 0.02
+
+
+class TestIntegerizeToTotal:
+    @pytest.mark.parametrize("total", [0, 3, 10, 17, 40])
+    def test_sums_to_total(self, total):
+        values = np.array([0.2, 3.7, 0.0, 5.5, 1.25, 0.35])
+        for seed in range(20):
+            result = util.integerize_to_total(
+                values, total, np.random.default_rng(seed)
+            )
+            assert result.sum() == total
+            assert (result >= 0).all()
+            # empty categories never get households
+            assert result[2] == 0
+
+    def test_all_rounded_to_zero(self):
+        values = np.array([1e-9, 4e-9, 3e-9, 2e-9])
+        result = util.integerize_to_total(values, 2, np.random.default_rng(0))
+        assert list(result) == [0, 1, 1, 0]
+
+    def test_matches_one_at_a_time(self):
+        def one_at_a_time(values, total, rng):
+            rounded = util.random_round_array(values, rng)
+            while rounded.sum() != total:
+                rows = np.flatnonzero(rounded)
+                rounded[rng.choice(rows)] += 1 if rounded.sum() < total else -1
+            return rounded
+
+        values = np.array([0.5, 5.5, 1.0, 0.7])
+        rng = np.random.default_rng(11)
+        for total in [2, 10]:
+            means = np.mean(
+                [util.integerize_to_total(values, total, rng) for i in range(4000)],
+                axis=0,
+            )
+            expected = np.mean(
+                [one_at_a_time(values, total, rng) for i in range(4000)], axis=0
+            )
+            assert np.allclose(means, expected, atol=0.06)
+
+    def test_surplus_removed_uniformly(self):
+        # one unit at a time from a row picked uniformly among the rows with
+        # units left, [3, 1] -> [2, 0] with probability 3 / 4
+        rng = np.random.default_rng(12)
+        results = [
+            tuple(util.integerize_to_total(np.array([3.0, 1.0]), 2, rng))
+            for i in range(4000)
+        ]
+        assert set(results) == {(2, 0), (1, 1)}
+        assert abs(results.count((2, 0)) / 4000 - 0.75) < 0.03
+
+        values = np.array([10.0, 1.0])
+        emptied = np.mean(
+            [util.integerize_to_total(values, 10, rng)[1] == 0 for i in range(4000)]
+        )
+        assert abs(emptied - 0.5) < 0.03
+
+
+class TestFileHash:
+    def test_file_hash(self, tmp_path):
+        import hashlib
+
+        path = tmp_path / "data.bin"
+        content = bytes(range(256)) * 5000
+        path.write_bytes(content)
+        assert (
+            util.file_hash(path, chunk_size=1000) == hashlib.sha256(content).hexdigest()
+        )
+        path.write_bytes(content + b"x")
+        assert util.file_hash(path) != hashlib.sha256(content).hexdigest()
+
 
 class TestFileCache:
     def test_file_cache(self):
@@ -5,11 +5,13 @@ Module that captures utility functions needed for Synthetic population
 generation
 """
 
-import math
-import random as rn
 import os
+import sys
+import resource
 import csv
 import uuid
+import hashlib
+import numpy as np
 import pandas as pd
 import pickle
 from logger import log
@@ -27,15 +29,107 @@ def random_round_to_integer(float_value, seed=None):
     returns float value that is rounded to an integer
 
     """
-    rn.seed(seed)
-    r_num = rn.random()
+    return int(random_round_array(float_value, np.random.default_rng(seed)))
 
-    threshold = float_value - int(float_value)
 
-    if r_num < threshold:
-        return math.ceil(float_value)
-    else:
-        return math.floor(float_value)
+def random_round_array(values, rng=None):
+    """
+    Function that stochastically rounds a whole array of values at once, each
+    value is rounded up with a probability equal to its fractional part
+
+    values: array like of the values you want to round to integers
+    rng: numpy Generator to use for reproducibility
+
+    returns integer numpy array with the same shape as values
+
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    values = np.asarray(values, dtype=float)
+    floors = np.floor(values)
+    return (floors + (rng.random(values.shape) < values - floors)).astype(np.int64)
+
+
+def integerize_to_total(values, total, rng=None):
+    """
+    Function that stochastically rounds an array of non negative values to
+    integers and then adjusts them with vectorized draws so that they sum to a
+    total (controlled rounding). As with adding or removing one household at
+    a time, a deficit is added uniformly across the non zero entries and a
+    surplus is removed uniformly across the entries that still have units,
+    so no entry goes negative.
+
+    If the rounding removes everything, the total largest values are set to 1.
+
+    values: array like of the values to round
+    total: the integer total the rounded values have to sum to
+    rng: numpy Generator to use for reproducibility
+
+    returns integer numpy array with the same shape as values
+
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    values = np.asarray(values, dtype=float)
+    total = int(total)
+
+    rounded = random_round_array(values, rng)
+
+    current = rounded.sum()
+    if current == 0:
+        rounded[np.argsort(-values, kind="stable")[:total]] = 1
+    elif current < total:
+        nonzero = np.flatnonzero(rounded)
+        rounded[nonzero] += rng.multinomial(
+            total - current, np.full(nonzero.size, 1.0 / nonzero.size)
+        )
+    elif current > total:
+        # the draws that hit an entry that ran out are drawn again over the
+        # entries left, which is the same as removing one unit at a time
+        surplus = current - total
+        while surplus > 0:
+            nonzero = np.flatnonzero(rounded)
+            removed = np.minimum(
+                rng.multinomial(surplus, np.full(nonzero.size, 1.0 / nonzero.size)),
+                rounded[nonzero],
+            )
+            rounded[nonzero] -= removed
+            surplus -= removed.sum()
+    return rounded
+
+
+def file_hash(file_name, chunk_size=1 << 20):
+    """
+    Function that computes the sha256 digest of the contents of a file,
+    reading it in chunks so large files are not loaded into memory
+
+    file_name: the file to hash
+    chunk_size: the number of bytes read at a time
+
+    returns the hex digest of the file
+
+    """
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def peak_rss_mb():
+    """
+    Function that reports the peak resident set size (memory usage) of this
+    process and of the largest of its finished child processes, such as
+    multiprocessing pool workers
+
+    returns tuple of (peak RSS of this process, peak RSS of the children) in MB
+
+    """
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return self_rss, children_rss
 
 
 class CSVFileCache: